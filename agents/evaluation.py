@@ -1,16 +1,22 @@
 # Evaluation Agent for Call Center Quality Assessment
+import io
 import os
-import json
+import orjson
 from datetime import datetime
-from openai import OpenAI
+from functools import lru_cache
+from pathlib import Path
 from typing import Dict, Any, Optional
 
 from config.settings import (
-    load_env_variable, ENV_VARS, OPENAI_MODELS,
+    OPENAI_MODELS,
     TEMPERATURE_SETTINGS, MAX_TOKEN_LIMITS, SYSTEM_PROMPTS,
     get_file_path
 )
-from utils.helpers import get_audio_file_identifier, clean_text_for_processing
+from utils.helpers import get_audio_file_identifier, clean_text_for_processing, compress_transcript_for_eval
+from utils.openai_client import (
+    get_openai_client, get_async_openai_client, check_prompt_budget, acheck_prompt_budget,
+    create_chat_completion, acreate_chat_completion
+)
 
 class EvaluationAgent:
     """Evaluates call center conversations across multiple quality dimensions."""
@@ -20,91 +26,78 @@ class EvaluationAgent:
         self.initialize_openai()
     
     def initialize_openai(self):
-        """Initialize OpenAI client."""
-        api_key = load_env_variable(ENV_VARS['OPENAI_API_KEY'], required=True)
-        if api_key:
-            self.client = OpenAI(api_key=api_key)
-            print("✅ OpenAI client initialized for evaluation")
-        else:
-            print("⚠️  OpenAI API key not found")
+        """Attach the shared OpenAI client."""
+        self.client = get_openai_client()
+        print("✅ OpenAI client initialized for evaluation")
     
     def evaluate_call(self, transcript_path: str, audio_url: Optional[str] = None) -> Dict[str, Any]:
         """Evaluate call quality from transcript."""
-        if not self.client:
-            return {
-                "status": "error",
-                "error_message": "OpenAI client not initialized"
-            }
-        
-        if not os.path.exists(transcript_path):
-            return {
-                "status": "error",
-                "error_message": f"Transcript file not found: {transcript_path}"
-            }
+        error = self._validate_inputs(self.client, transcript_path)
+        if error:
+            return error
         
         file_id = get_audio_file_identifier(audio_url, transcript_path)
         
         try:
-            # Read transcript
-            with open(transcript_path, 'r', encoding='utf-8') as f:
-                transcript = f.read()
-            
-            if not transcript.strip():
+            transcript = self._load_transcript(transcript_path)
+            if not transcript:
                 return {
                     "status": "error",
                     "error_message": "Transcript is empty"
                 }
             
-            transcript = clean_text_for_processing(transcript)
+            budget_error = check_prompt_budget(transcript, OPENAI_MODELS['EVALUATION'])
+            if budget_error:
+                return {
+                    "status": "error",
+                    "file_identifier": file_id,
+                    "error_message": budget_error
+                }
             
             # Generate evaluation using OpenAI
-            messages = [
-                {"role": "system", "content": SYSTEM_PROMPTS['EVALUATION']},
-                {"role": "user", "content": f"Please evaluate this call center transcript:\n\n{transcript}"}
-            ]
-            
-            response = self.client.chat.completions.create(
-                model=OPENAI_MODELS['EVALUATION'],
-                messages=messages,
-                temperature=TEMPERATURE_SETTINGS['EVALUATION'],
-                max_tokens=MAX_TOKEN_LIMITS['EVALUATION'],
-                response_format={"type": "json_object"}
+            content, usage, cache_hit = create_chat_completion(
+                self.client, self._build_request(transcript), semantic_text=transcript
             )
             
-            evaluation_text = response.choices[0].message.content
-            if not evaluation_text:
+            return self._build_result(content, usage, file_id, audio_url, transcript_path, cache_hit)
+            
+        except Exception as e:
+            return {
+                "status": "error",
+                "file_identifier": file_id,
+                "error_message": f"Evaluation failed: {str(e)}"
+            }
+    
+    async def evaluate_call_async(self, transcript_path: str, audio_url: Optional[str] = None) -> Dict[str, Any]:
+        """Evaluate call quality from transcript without blocking the event loop."""
+        error = self._validate_inputs(self.client, transcript_path)
+        if error:
+            return error
+        
+        file_id = get_audio_file_identifier(audio_url, transcript_path)
+        
+        try:
+            transcript = self._load_transcript(transcript_path)
+            if not transcript:
                 return {
                     "status": "error",
-                    "error_message": "OpenAI returned empty evaluation"
+                    "error_message": "Transcript is empty"
                 }
             
-            # Parse evaluation JSON
-            try:
-                evaluation_data = json.loads(evaluation_text)
-            except json.JSONDecodeError:
-                # If JSON parsing fails, create structured data from text
-                evaluation_data = self._parse_evaluation_text(evaluation_text)
-            
-            # Save evaluation to files
-            json_path = get_file_path('EVALUATION_JSON', file_id)
-            txt_path = get_file_path('EVALUATION_TXT', file_id)
+            budget_error = await acheck_prompt_budget(transcript, OPENAI_MODELS['EVALUATION'])
+            if budget_error:
+                return {
+                    "status": "error",
+                    "file_identifier": file_id,
+                    "error_message": budget_error
+                }
             
-            self._save_evaluation_files(json_path, txt_path, evaluation_data, 
-                                      file_id, audio_url, transcript_path)
+            # Generate evaluation using OpenAI
+            content, usage, cache_hit = await acreate_chat_completion(
+                get_async_openai_client(), self._build_request(transcript), semantic_text=transcript
+            )
             
-            return {
-                "status": "success",
-                "file_identifier": file_id,
-                "evaluation_data": evaluation_data,
-                "evaluation_json_path": str(json_path),
-                "evaluation_txt_path": str(txt_path),
-                "model_used": OPENAI_MODELS['EVALUATION'],
-                "token_usage": {
-                    "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
-                    "completion_tokens": response.usage.completion_tokens if response.usage else 0,
-                    "total_tokens": response.usage.total_tokens if response.usage else 0
-                }
-            }
+            return self._build_result(content, usage, file_id, audio_url, transcript_path, cache_hit)
             
         except Exception as e:
             return {
@@ -113,6 +106,85 @@ class EvaluationAgent:
                 "error_message": f"Evaluation failed: {str(e)}"
             }
     
+    def _validate_inputs(self, client, transcript_path: str) -> Optional[Dict[str, Any]]:
+        """Return an error result if the evaluation cannot run, otherwise None."""
+        if not client:
+            return {
+                "status": "error",
+                "error_message": "OpenAI client not initialized"
+            }
+        
+        if not os.path.exists(transcript_path):
+            return {
+                "status": "error",
+                "error_message": f"Transcript file not found: {transcript_path}"
+            }
+        
+        return None
+    
+    def _load_transcript(self, transcript_path: str) -> str:
+        """Read, compact and clean the transcript; returns an empty string if there is no content."""
+        # Empty files are caught by a stat instead of reading them
+        if os.path.getsize(transcript_path) == 0:
+            return ""
+        
+        # Compacting needs the line structure, so it runs before whitespace is collapsed
+        transcript = Path(transcript_path).read_text(encoding='utf-8')
+        return clean_text_for_processing(compress_transcript_for_eval(transcript))
+    
+    def _build_request(self, transcript: str) -> Dict[str, Any]:
+        """Build the chat completion request parameters for a transcript."""
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPTS['EVALUATION']},
+            {"role": "user", "content": f"Please evaluate this call center transcript:\n\n{transcript}"}
+        ]
+        
+        return {
+            "model": OPENAI_MODELS['EVALUATION'],
+            "messages": messages,
+            "temperature": TEMPERATURE_SETTINGS['EVALUATION'],
+            "max_tokens": MAX_TOKEN_LIMITS['EVALUATION'],
+            "response_format": {"type": "json_object"}
+        }
+    
+    def _build_result(self, evaluation_text: Optional[str], usage, file_id: str, audio_url: Optional[str],
+                      transcript_path: str, cache_hit: bool = False) -> Dict[str, Any]:
+        """Parse the OpenAI response, save evaluation files and build the result."""
+        if not evaluation_text:
+            return {
+                "status": "error",
+                "error_message": "OpenAI returned empty evaluation"
+            }
+        
+        # Parse evaluation JSON
+        try:
+            evaluation_data = orjson.loads(evaluation_text)
+        except orjson.JSONDecodeError:
+            # If JSON parsing fails, create structured data from text
+            evaluation_data = self._parse_evaluation_text(evaluation_text)
+        
+        # Save evaluation to files
+        json_path = get_file_path('EVALUATION_JSON', file_id)
+        txt_path = get_file_path('EVALUATION_TXT', file_id)
+        
+        self._save_evaluation_files(json_path, txt_path, evaluation_data, 
+                                  file_id, audio_url, transcript_path)
+        
+        return {
+            "status": "success",
+            "file_identifier": file_id,
+            "evaluation_data": evaluation_data,
+            "evaluation_json_path": str(json_path),
+            "evaluation_txt_path": str(txt_path),
+            "model_used": OPENAI_MODELS['EVALUATION'],
+            "cache_hit": cache_hit,
+            "token_usage": {
+                "prompt_tokens": usage.prompt_tokens if usage else 0,
+                "completion_tokens": usage.completion_tokens if usage else 0,
+                "total_tokens": usage.total_tokens if usage else 0
+            }
+        }
+    
     def _parse_evaluation_text(self, text: str) -> Dict[str, Any]:
         """Parse evaluation text into structured data if JSON parsing fails."""
         return {
@@ -134,11 +206,9 @@ class EvaluationAgent:
     def _save_evaluation_files(self, json_path: str, txt_path: str, evaluation_data: dict,
                               file_id: str, audio_url: Optional[str], transcript_path: str):
         """Save evaluation in both JSON and text formats."""
-        # Save JSON file
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(evaluation_data, f, indent=2, ensure_ascii=False)
+        # Build both payloads up front so each file is written in a single call
+        json_bytes = orjson.dumps(evaluation_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
         
-        # Save text report
         header = f"""
 Evaluation Report for: {file_id}
 Audio URL: {audio_url or 'N/A'}
@@ -147,46 +217,63 @@ Generated on: {datetime.now().isoformat()}
 =======================================================
 
 """
+        txt_bytes = (header + self._format_evaluation_as_text(evaluation_data)).encode('utf-8')
         
-        # Format evaluation data as readable text
-        text_content = self._format_evaluation_as_text(evaluation_data)
-        
-        with open(txt_path, 'w', encoding='utf-8') as f:
-            f.write(header + text_content)
+        Path(json_path).write_bytes(json_bytes)
+        Path(txt_path).write_bytes(txt_bytes)
     
     def _format_evaluation_as_text(self, evaluation_data: dict) -> str:
         """Format evaluation data as readable text."""
-        text = ""
+        buf = io.StringIO()
         
         if "evaluation_summary" in evaluation_data:
-            summary = evaluation_data["evaluation_summary"]
-            text += "EVALUATION SCORES:\n"
-            text += "=" * 20 + "\n"
+            buf.write("EVALUATION SCORES:\n")
+            buf.write("=" * 20 + "\n")
             
-            for key, value in summary.items():
-                if isinstance(value, (int, float)) and key != "overall_score":
-                    text += f"{key.replace('_', ' ').title()}: {value}/10\n"
-                elif key == "overall_score":
-                    text += f"Overall Score: {value}/10\n"
-                else:
-                    text += f"{key.replace('_', ' ').title()}: {value}\n"
+            for key, value in evaluation_data["evaluation_summary"].items():
+                suffix = "/10" if key == "overall_score" or isinstance(value, (int, float)) else ""
+                buf.write(f"{_summary_label(key)}: {value}{suffix}\n")
             
-            text += "\n"
+            buf.write("\n")
         
         if "detailed_analysis" in evaluation_data:
-            text += "DETAILED ANALYSIS:\n"
-            text += "=" * 20 + "\n"
-            text += evaluation_data["detailed_analysis"]
+            buf.write("DETAILED ANALYSIS:\n")
+            buf.write("=" * 20 + "\n")
+            buf.write(evaluation_data["detailed_analysis"])
         
-        return text
+        return buf.getvalue()
+
+
+@lru_cache(maxsize=256)
+def _summary_label(key: str) -> str:
+    """Display label for an evaluation summary key (keys repeat across every call)."""
+    if key == "overall_score":
+        return "Overall Score"
+    return key.replace('_', ' ').title()
+
+
+_agent = None
+
+def _get_agent() -> EvaluationAgent:
+    """Get the module's shared EvaluationAgent; agents hold no per-call state."""
+    global _agent
+    if _agent is None:
+        _agent = EvaluationAgent()
+    return _agent
 
 
 def process_evaluation(transcript_path: str, audio_url: Optional[str] = None) -> Dict[str, Any]:
     """Main function to process call evaluation."""
-    agent = EvaluationAgent()
+    agent = _get_agent()
     return agent.evaluate_call(transcript_path, audio_url)
 
 
+async def process_evaluation_async(transcript_path: str, audio_url: Optional[str] = None) -> Dict[str, Any]:
+    """Async variant of process_evaluation using the AsyncOpenAI client."""
+    agent = _get_agent()
+    return await agent.evaluate_call_async(transcript_path, audio_url)
+
+
 if __name__ == "__main__":
     # Test evaluation agent
     print("Testing Evaluation Agent...")
@@ -2,28 +2,46 @@
 import os
 import sys
 import json
+import orjson
+import asyncio
+import time
 import gdown
+import httpx
 import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Awaitable
 from pathlib import Path
 
 # Add project root to path for imports
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from config.settings import OUTPUTS_DIR
+from openai.types.chat import ChatCompletion
+
+from config.settings import (
+    OUTPUTS_DIR, OPENAI_MODELS, BATCH_API_SETTINGS, MAX_CONCURRENT_FILES, MAX_CONCURRENT_DOWNLOADS,
+    MAX_PREFETCHED_FILES, GOOGLE_DRIVE_DOWNLOAD_URL, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_TIMEOUT_SECONDS
+)
 from utils.helpers import (
     extract_google_drive_file_id, get_audio_file_identifier, 
     validate_audio_file, create_temp_audio_file
 )
+from utils.openai_client import (
+    call_with_retries, check_prompt_budget, run_on_pipeline_loop, run_on_pipeline_loop_sync
+)
 
 # Import all agent processors
-from agents.transcription import process_transcription
-from agents.noise_analysis import process_noise_analysis
-from agents.summary import process_summary
-from agents.evaluation import process_evaluation
-from agents.recommendation import process_recommendations
+from agents.transcription import process_transcription, process_transcription_async
+from agents.noise_analysis import process_noise_analysis, process_noise_analysis_async
+from agents.summary import SummaryAgent, process_summary_async
+from agents.evaluation import EvaluationAgent, process_evaluation_async
+from agents.recommendation import RecommendationAgent, process_recommendations_async
+
+# Pipeline steps reported in processing and batch summaries
+PIPELINE_STEPS = ("transcription", "noise_analysis", "evaluation", "summary", "recommendations")
 
 class MasterAgent:
     """Orchestrates the complete call center analysis pipeline."""
@@ -31,9 +49,23 @@ class MasterAgent:
     def __init__(self):
         self.results = {}
         self.temp_files = []
+        self._temp_files_lock = threading.Lock()
     
     def process_audio_file(self, audio_url: str, custom_prompt: Optional[str] = None) -> Dict[str, Any]:
         """Process a single audio file through the complete pipeline."""
+        return run_on_pipeline_loop_sync(self._process_audio_file(audio_url, custom_prompt))
+    
+    async def process_audio_file_async(self, audio_url: str, custom_prompt: Optional[str] = None) -> Dict[str, Any]:
+        """Process a single audio file on the shared pipeline loop, so all files reuse one OpenAI client."""
+        return await run_on_pipeline_loop(self._process_audio_file(audio_url, custom_prompt))
+    
+    async def _process_audio_file(self, audio_url: str, custom_prompt: Optional[str] = None,
+                                  audio_download: Optional[Awaitable[Optional[str]]] = None) -> Dict[str, Any]:
+        """Process a single audio file, running independent stages concurrently.
+        
+        audio_download can be an already-started download (see _process_multiple_files);
+        otherwise the file is downloaded here.
+        """
         
         print(f"🎯 Starting Master Agent processing for: {audio_url}")
         
@@ -45,72 +77,87 @@ class MasterAgent:
             "processing_start_time": datetime.now().isoformat(),
             "status": "processing",
             "results": {},
-            "errors": []
+            "errors": [],
+            "timing": {}
         }
+        timing = result["timing"]
+        start_ns = time.monotonic_ns()
+        audio_path = None
+        noise_task = None
+        summary_task = None
         
         try:
             # Step 1: Download audio file
             print("📥 Step 1: Downloading audio file...")
-            audio_path = self._download_audio(audio_url)
+            if audio_download is None:
+                audio_download = asyncio.to_thread(self._download_audio, audio_url)
+            audio_path = await self._timed(audio_download, timing, "download")
             if not audio_path:
                 result["status"] = "error"
                 result["errors"].append("Failed to download audio file")
                 return result
             
+            # Step 3 only needs the audio, so it runs alongside transcription
+            print("🔊 Step 3: Running noise analysis...")
+            noise_task = asyncio.create_task(
+                self._timed(process_noise_analysis_async(audio_path, audio_url), timing, "noise_analysis")
+            )
+            
             # Step 2: Run transcription
             print("🗣️ Step 2: Running transcription...")
-            transcription_result = process_transcription(audio_path, audio_url)
+            transcription_result = await self._timed(
+                process_transcription_async(audio_path, audio_url), timing, "transcription"
+            )
             result["results"]["transcription"] = transcription_result
             
             if transcription_result.get("status") != "success":
                 result["errors"].append("Transcription failed")
                 # Continue with other analyses that don't depend on transcript
             
-            # Step 3: Run noise analysis
-            print("🔊 Step 3: Running noise analysis...")
-            noise_result = process_noise_analysis(audio_path, audio_url)
-            result["results"]["noise_analysis"] = noise_result
-            
-            if noise_result.get("status") != "success":
-                result["errors"].append("Noise analysis failed")
-            
-            # Step 4: Run evaluation (if transcription succeeded)
+            # Steps 4-6: summary only needs the transcript, so it runs alongside evaluation
+            # and the recommendations that follow it (if transcription succeeded)
+            # Checked once; the transcript does not change during the remaining steps
             transcript_path = transcription_result.get("transcript_path")
-            if transcript_path and os.path.exists(transcript_path):
+            transcript_ready = bool(transcript_path) and os.path.exists(transcript_path)
+            if transcript_ready:
                 print("📊 Step 4: Running evaluation...")
-                evaluation_result = process_evaluation(transcript_path, audio_url)
+                print("📝 Step 5: Running summary...")
+                summary_task = asyncio.create_task(
+                    self._timed(process_summary_async(transcript_path, audio_url), timing, "summary")
+                )
+                evaluation_result = await self._settle(
+                    self._timed(process_evaluation_async(transcript_path, audio_url), timing, "evaluation")
+                )
                 result["results"]["evaluation"] = evaluation_result
                 
-                if evaluation_result.get("status") != "success":
-                    result["errors"].append("Evaluation failed")
-            else:
-                result["errors"].append("Skipped evaluation - no transcript available")
-            
-            # Step 5: Run summary (if transcription succeeded)
-            if transcript_path and os.path.exists(transcript_path):
-                print("📝 Step 5: Running summary...")
-                summary_result = process_summary(transcript_path, audio_url)
-                result["results"]["summary"] = summary_result
+                print("💡 Step 6: Running recommendations...")
+                rec_result = await self._settle(self._timed(
+                    process_recommendations_async(
+                        transcript_path, evaluation_result.get("evaluation_json_path"), audio_url
+                    ),
+                    timing, "recommendations"
+                ))
+                result["results"]["summary"] = await self._settle(summary_task)
+                result["results"]["recommendations"] = rec_result
                 
-                if summary_result.get("status") != "success":
+                if result["results"]["evaluation"].get("status") != "success":
+                    result["errors"].append("Evaluation failed")
+                if result["results"]["summary"].get("status") != "success":
                     result["errors"].append("Summary failed")
             else:
+                result["errors"].append("Skipped evaluation - no transcript available")
                 result["errors"].append("Skipped summary - no transcript available")
             
-            # Step 6: Run recommendations (if transcript and evaluation succeeded)
-            evaluation_json_path = None
-            if "evaluation" in result["results"]:
-                evaluation_json_path = result["results"]["evaluation"].get("evaluation_json_path")
+            noise_result = await self._settle(noise_task)
+            result["results"]["noise_analysis"] = noise_result
             
-            if transcript_path and os.path.exists(transcript_path):
-                print("💡 Step 6: Running recommendations...")
-                rec_result = process_recommendations(transcript_path, evaluation_json_path, audio_url)
-                result["results"]["recommendations"] = rec_result
-                
-                if rec_result.get("status") != "success":
-                    result["errors"].append("Recommendations failed")
-            else:
+            if noise_result.get("status") != "success":
+                result["errors"].append("Noise analysis failed")
+            
+            if not transcript_ready:
                 result["errors"].append("Skipped recommendations - no transcript available")
+            elif result["results"]["recommendations"].get("status") != "success":
+                result["errors"].append("Recommendations failed")
             
             # Finalize result
             result["processing_end_time"] = datetime.now().isoformat()
@@ -128,14 +175,36 @@ class MasterAgent:
             print(f"❌ Master Agent processing failed: {str(e)}")
         
         finally:
-            # Clean up temporary files
-            self._cleanup_temp_files()
+            # Let noise analysis finish reading the audio (and summary finish) before cleanup
+            pending = [task for task in (noise_task, summary_task) if task is not None and not task.done()]
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            
+            # Clean up this file's temporary audio (other files may still be in flight)
+            if audio_path:
+                await asyncio.to_thread(self._cleanup_temp_files, [audio_path])
+            
+            timing["total"] = (time.monotonic_ns() - start_ns) / 1e6
         
         return result
     
     def process_multiple_files(self, audio_urls: List[str], 
                              custom_prompt: Optional[str] = None) -> Dict[str, Any]:
         """Process multiple audio files."""
+        return run_on_pipeline_loop_sync(self._process_multiple_files(audio_urls, custom_prompt))
+    
+    async def process_multiple_files_async(self, audio_urls: List[str],
+                                           custom_prompt: Optional[str] = None) -> Dict[str, Any]:
+        """Process multiple audio files on the shared pipeline loop."""
+        return await run_on_pipeline_loop(self._process_multiple_files(audio_urls, custom_prompt))
+    
+    async def _process_multiple_files(self, audio_urls: List[str],
+                                      custom_prompt: Optional[str] = None) -> Dict[str, Any]:
+        """Process multiple audio files concurrently, bounded by MAX_CONCURRENT_FILES.
+        
+        Downloads are prefetched, but each file holds one of MAX_PREFETCHED_FILES slots from
+        the start of its download until it is processed and cleaned up.
+        """
         
         print(f"🎯 Starting batch processing for {len(audio_urls)} files")
         
@@ -149,10 +218,34 @@ class MasterAgent:
             "batch_summary": {}
         }
         
-        for i, audio_url in enumerate(audio_urls, 1):
-            print(f"\n📁 Processing file {i}/{len(audio_urls)}")
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_FILES)
+        prefetch_slots = asyncio.Semaphore(MAX_PREFETCHED_FILES)
+        loop = asyncio.get_running_loop()
+        
+        async def process_one(i: int, audio_url: str, download_pool) -> Dict[str, Any]:
+            async with prefetch_slots:
+                # Download while earlier files are still being processed
+                audio_download = loop.run_in_executor(download_pool, self._download_audio, audio_url)
+                async with semaphore:
+                    print(f"\n📁 Processing file {i}/{len(audio_urls)}")
+                    return await self._process_audio_file(audio_url, custom_prompt, audio_download)
+        
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DOWNLOADS) as download_pool:
+            file_results = await asyncio.gather(
+                *(process_one(i, audio_url, download_pool) for i, audio_url in enumerate(audio_urls, 1)),
+                return_exceptions=True
+            )
+        
+        for audio_url, file_result in zip(audio_urls, file_results):
+            if isinstance(file_result, BaseException):
+                file_result = {
+                    "file_identifier": get_audio_file_identifier(audio_url),
+                    "audio_url": audio_url,
+                    "status": "error",
+                    "results": {},
+                    "errors": [f"Master processing error: {str(file_result)}"]
+                }
             
-            file_result = self.process_audio_file(audio_url, custom_prompt)
             batch_result["files"].append(file_result)
             batch_result["processed_files"] += 1
             
@@ -168,8 +261,287 @@ class MasterAgent:
         
         return batch_result
     
-    def _download_audio(self, audio_url: str) -> Optional[str]:
-        """Download audio file from Google Drive."""
+    def process_multiple_files_batch(self, audio_urls: List[str],
+                                     custom_prompt: Optional[str] = None) -> Dict[str, Any]:
+        """Process multiple audio files, submitting the chat stages through the OpenAI Batch API.
+        
+        Download, transcription and noise analysis still run in real time. Evaluation and
+        summary requests for every file are then submitted as one batch, followed by a
+        second batch for recommendations (which need the evaluation output).
+        """
+        
+        print(f"🎯 Starting Batch API processing for {len(audio_urls)} files")
+        
+        batch_result = {
+            "batch_start_time": datetime.now().isoformat(),
+            "total_files": len(audio_urls),
+            "processed_files": 0,
+            "successful_files": 0,
+            "failed_files": 0,
+            "files": [],
+            "batch_summary": {}
+        }
+        
+        # All audio for the batch lives in one directory, removed in a single rmtree
+        with tempfile.TemporaryDirectory(prefix="mustami3_batch_") as temp_dir:
+            audio_paths = self._download_audio_many(audio_urls, temp_dir)
+            for i, audio_url in enumerate(audio_urls, 1):
+                print(f"\n📁 Running real-time stages for file {i}/{len(audio_urls)}")
+                batch_result["files"].append(self._process_realtime_stages(audio_url, audio_paths[audio_url]))
+        
+        evaluation_agent = EvaluationAgent()
+        summary_agent = SummaryAgent()
+        recommendation_agent = RecommendationAgent()
+        
+        # Load each usable transcript once (evaluation gets its compacted form); files
+        # without one skip the chat stages
+        transcripts = {}
+        for index, file_result in enumerate(batch_result["files"]):
+            if file_result["status"] == "error":
+                continue
+            transcript_path = file_result["results"].get("transcription", {}).get("transcript_path")
+            if not transcript_path or not os.path.exists(transcript_path):
+                continue
+            try:
+                transcript = summary_agent._load_transcript(transcript_path)
+                evaluation_transcript = evaluation_agent._load_transcript(transcript_path)
+            except Exception as e:
+                file_result["errors"].append(f"Could not read transcript: {str(e)}")
+                continue
+            if not transcript:
+                continue
+            budget_error = check_prompt_budget(transcript, OPENAI_MODELS['EVALUATION'])
+            if budget_error:
+                file_result["errors"].append(budget_error)
+                continue
+            transcripts[index] = (transcript_path, transcript, evaluation_transcript)
+        
+        # Round 1: evaluation and summary only need the transcript
+        requests = []
+        for index, (transcript_path, transcript, evaluation_transcript) in transcripts.items():
+            file_result = batch_result["files"][index]
+            requests.append(self._batch_request(index, file_result, "evaluation",
+                                                evaluation_agent._build_request(evaluation_transcript)))
+            requests.append(self._batch_request(index, file_result, "summary",
+                                                summary_agent._build_request(transcript)))
+        
+        outputs = self._run_openai_batch(evaluation_agent.client, requests)
+        
+        for index, (transcript_path, transcript, _) in transcripts.items():
+            file_result = batch_result["files"][index]
+            file_id = file_result["file_identifier"]
+            audio_url = file_result["audio_url"]
+            file_result["results"]["evaluation"] = self._batch_step_result(
+                outputs, index, file_result, "evaluation",
+                lambda response: evaluation_agent._build_result(response.choices[0].message.content, response.usage,
+                                                                file_id, audio_url, transcript_path))
+            file_result["results"]["summary"] = self._batch_step_result(
+                outputs, index, file_result, "summary",
+                lambda response: summary_agent._build_result(response.choices[0].message.content, response.usage,
+                                                             file_id, audio_url, transcript_path))
+        
+        # Round 2: recommendations use the evaluation results from round 1
+        requests = []
+        for index, (transcript_path, transcript, _) in transcripts.items():
+            file_result = batch_result["files"][index]
+            evaluation_json_path = file_result["results"]["evaluation"].get("evaluation_json_path")
+            requests.append(self._batch_request(index, file_result, "recommendations",
+                                                recommendation_agent._build_request(transcript, evaluation_json_path)))
+        
+        outputs = self._run_openai_batch(recommendation_agent.client, requests)
+        
+        for index, (transcript_path, transcript, _) in transcripts.items():
+            file_result = batch_result["files"][index]
+            file_id = file_result["file_identifier"]
+            audio_url = file_result["audio_url"]
+            evaluation_json_path = file_result["results"]["evaluation"].get("evaluation_json_path")
+            file_result["results"]["recommendations"] = self._batch_step_result(
+                outputs, index, file_result, "recommendations",
+                lambda response: recommendation_agent._build_result(response.choices[0].message.content,
+                                                                    response.usage, file_id, audio_url,
+                                                                    transcript_path, evaluation_json_path))
+        
+        # Finalize per-file results
+        for file_result in batch_result["files"]:
+            if file_result["status"] != "error":
+                for step, label in (("evaluation", "Evaluation"), ("summary", "Summary"),
+                                    ("recommendations", "Recommendations")):
+                    if step not in file_result["results"]:
+                        file_result["errors"].append(f"Skipped {step} - no transcript available")
+                    elif file_result["results"][step].get("status") != "success":
+                        file_result["errors"].append(f"{label} failed")
+                
+                file_result["processing_end_time"] = datetime.now().isoformat()
+                file_result["status"] = "completed" if not file_result["errors"] else "completed_with_errors"
+                file_result["processing_summary"] = self._create_processing_summary(file_result)
+            
+            batch_result["processed_files"] += 1
+            if file_result["status"] in ["completed", "completed_with_errors"]:
+                batch_result["successful_files"] += 1
+            else:
+                batch_result["failed_files"] += 1
+        
+        batch_result["batch_end_time"] = datetime.now().isoformat()
+        batch_result["batch_summary"] = self._create_batch_summary(batch_result)
+        
+        print(f"\n✅ Batch API processing completed: {batch_result['successful_files']} successful, {batch_result['failed_files']} failed")
+        
+        return batch_result
+    
+    def _process_realtime_stages(self, audio_url: str, audio_path: Optional[str]) -> Dict[str, Any]:
+        """Transcribe and noise-analyze a downloaded file ahead of batch submission."""
+        file_id = get_audio_file_identifier(audio_url)
+        result = {
+            "file_identifier": file_id,
+            "audio_url": audio_url,
+            "processing_start_time": datetime.now().isoformat(),
+            "status": "processing",
+            "results": {},
+            "errors": []
+        }
+        
+        if not audio_path:
+            result["status"] = "error"
+            result["errors"].append("Failed to download audio file")
+            return result
+        
+        try:
+            result["results"]["transcription"] = process_transcription(audio_path, audio_url)
+            if result["results"]["transcription"].get("status") != "success":
+                result["errors"].append("Transcription failed")
+            
+            result["results"]["noise_analysis"] = process_noise_analysis(audio_path, audio_url)
+            if result["results"]["noise_analysis"].get("status") != "success":
+                result["errors"].append("Noise analysis failed")
+            
+        except Exception as e:
+            result["status"] = "error"
+            result["errors"].append(f"Master processing error: {str(e)}")
+            result["processing_end_time"] = datetime.now().isoformat()
+        
+        return result
+    
+    def _batch_request(self, index: int, file_result: Dict[str, Any], step: str,
+                       body: Dict[str, Any]) -> Dict[str, Any]:
+        """Build one Batch API request line for a pipeline step."""
+        return {
+            "custom_id": f"{index}:{file_result['file_identifier']}:{step}",
+            "method": "POST",
+            "url": BATCH_API_SETTINGS['ENDPOINT'],
+            "body": body
+        }
+    
+    def _batch_step_result(self, outputs: Dict[str, Any], index: int, file_result: Dict[str, Any],
+                           step: str, build_result) -> Dict[str, Any]:
+        """Turn a demultiplexed batch output into the step result used by the pipeline."""
+        outcome = outputs.get(f"{index}:{file_result['file_identifier']}:{step}")
+        
+        if outcome is None:
+            return {
+                "status": "error",
+                "file_identifier": file_result["file_identifier"],
+                "error_message": f"No batch output returned for {step}"
+            }
+        
+        if isinstance(outcome, str):
+            return {
+                "status": "error",
+                "file_identifier": file_result["file_identifier"],
+                "error_message": outcome
+            }
+        
+        try:
+            return build_result(outcome)
+        except Exception as e:
+            return {
+                "status": "error",
+                "file_identifier": file_result["file_identifier"],
+                "error_message": f"Failed to process batch output for {step}: {str(e)}"
+            }
+    
+    def _run_openai_batch(self, client, requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Submit chat requests through the Batch API and wait for the results.
+        
+        Returns a mapping of custom_id to either a ChatCompletion or an error message.
+        """
+        if not requests:
+            return {}
+        
+        if not client:
+            return {request["custom_id"]: "OpenAI client not initialized" for request in requests}
+        
+        input_path = None
+        try:
+            with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8', delete=False) as f:
+                input_path = f.name
+                for request in requests:
+                    f.write(json.dumps(request, ensure_ascii=False) + "\n")
+            
+            # Upload by path so a retried upload re-reads the whole file
+            input_file = call_with_retries(client.files.create, file=Path(input_path), purpose="batch")
+            
+            batch = call_with_retries(
+                client.batches.create,
+                input_file_id=input_file.id,
+                endpoint=BATCH_API_SETTINGS['ENDPOINT'],
+                completion_window=BATCH_API_SETTINGS['COMPLETION_WINDOW']
+            )
+            print(f"📦 Submitted batch {batch.id} with {len(requests)} requests")
+            
+            while batch.status not in ("completed", "failed", "expired", "cancelled"):
+                time.sleep(BATCH_API_SETTINGS['POLL_INTERVAL_SECONDS'])
+                batch = call_with_retries(client.batches.retrieve, batch.id)
+            
+            print(f"📦 Batch {batch.id} finished with status: {batch.status}")
+            
+            outputs = {}
+            if batch.output_file_id:
+                for line in call_with_retries(client.files.content, batch.output_file_id).text.splitlines():
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    response = record.get("response") or {}
+                    if response.get("status_code") == 200:
+                        outputs[record["custom_id"]] = ChatCompletion.model_validate(response["body"])
+                    else:
+                        error = (response.get("body") or {}).get("error") or record.get("error") or {}
+                        outputs[record["custom_id"]] = f"Batch request failed: {error.get('message', 'unknown error')}"
+            
+            if batch.error_file_id:
+                for line in call_with_retries(client.files.content, batch.error_file_id).text.splitlines():
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    error = record.get("error") or {}
+                    outputs.setdefault(record["custom_id"],
+                                       f"Batch request failed: {error.get('message', 'unknown error')}")
+            
+            for request in requests:
+                outputs.setdefault(request["custom_id"], f"Batch {batch.id} ended with status: {batch.status}")
+            
+            return outputs
+            
+        except Exception as e:
+            print(f"❌ Batch submission failed: {str(e)}")
+            return {request["custom_id"]: f"Batch submission failed: {str(e)}" for request in requests}
+        
+        finally:
+            if input_path and os.path.exists(input_path):
+                os.remove(input_path)
+    
+    def _download_audio_many(self, audio_urls: List[str], temp_dir: Optional[str] = None) -> Dict[str, Optional[str]]:
+        """Download several audio files in parallel; maps each URL to its local path (None on failure)."""
+        unique_urls = list(dict.fromkeys(audio_urls))
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DOWNLOADS) as executor:
+            paths = executor.map(lambda url: self._download_audio(url, temp_dir), unique_urls)
+            return dict(zip(unique_urls, paths))
+    
+    def _download_audio(self, audio_url: str, temp_dir: Optional[str] = None) -> Optional[str]:
+        """Download audio file from Google Drive.
+        
+        Files created inside temp_dir are owned by that directory and are not tracked here.
+        """
+        temp_path = None
         try:
             file_id = extract_google_drive_file_id(audio_url)
             if not file_id:
@@ -177,20 +549,27 @@ class MasterAgent:
                 return None
             
             # Create temporary file
-            temp_path = create_temp_audio_file()
-            self.temp_files.append(temp_path)
+            temp_path = create_temp_audio_file(directory=temp_dir)
+            if temp_dir is None:
+                with self._temp_files_lock:
+                    self.temp_files.append(temp_path)
             
-            # Download using gdown
-            output_path = gdown.download(url=audio_url, output=temp_path, quiet=False, fuzzy=True)
+            # Stream the file directly; gdown handles the cases Drive gates behind a confirmation page
+            if self._download_drive_file(file_id, temp_path):
+                output_path = temp_path
+            else:
+                output_path = gdown.download(url=audio_url, output=temp_path, quiet=False, fuzzy=True)
             
             if not output_path or not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
                 print(f"❌ Download failed or file is empty")
+                self._cleanup_temp_files([temp_path])
                 return None
             
             # Validate the downloaded file
             validation = validate_audio_file(temp_path)
             if not validation['valid']:
                 print(f"❌ Downloaded file validation failed: {validation['error']}")
+                self._cleanup_temp_files([temp_path])
                 return None
             
             print(f"✅ Successfully downloaded: {validation['size_mb']:.1f} MB")
@@ -198,8 +577,51 @@ class MasterAgent:
             
         except Exception as e:
             print(f"❌ Download error: {str(e)}")
+            if temp_path:
+                self._cleanup_temp_files([temp_path])
             return None
     
+    def _download_drive_file(self, file_id: str, output_path: str) -> bool:
+        """Stream a public Google Drive file to output_path; returns False if Drive did not serve the file."""
+        params = {"id": file_id, "export": "download", "confirm": "t"}
+        try:
+            with httpx.stream("GET", GOOGLE_DRIVE_DOWNLOAD_URL, params=params, follow_redirects=True,
+                              timeout=DOWNLOAD_TIMEOUT_SECONDS) as response:
+                # An HTML page means a login/permission or confirmation challenge, not the file
+                content_type = response.headers.get("content-type", "")
+                if response.status_code != 200 or content_type.startswith("text/html"):
+                    return False
+                
+                with open(output_path, 'wb') as f:
+                    for chunk in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+            return True
+        
+        except httpx.HTTPError as e:
+            print(f"⚠️  Direct download failed ({str(e)}), falling back to gdown")
+            return False
+    
+    async def _timed(self, awaitable: Awaitable[Any], timing: Dict[str, float], stage: str) -> Any:
+        """Await a pipeline stage, recording its duration in milliseconds under timing[stage]."""
+        start_ns = time.monotonic_ns()
+        try:
+            return await awaitable
+        finally:
+            timing[stage] = (time.monotonic_ns() - start_ns) / 1e6
+    
+    async def _settle(self, awaitable: Awaitable[Dict[str, Any]]) -> Dict[str, Any]:
+        """Await a pipeline stage, turning an exception it raises into an error result."""
+        return self._as_step_result((await asyncio.gather(awaitable, return_exceptions=True))[0])
+    
+    def _as_step_result(self, outcome: Any) -> Dict[str, Any]:
+        """Convert an exception raised by a concurrent stage into an error result."""
+        if isinstance(outcome, BaseException):
+            return {
+                "status": "error",
+                "error_message": str(outcome)
+            }
+        return outcome
+    
     def _create_processing_summary(self, result: Dict[str, Any]) -> Dict[str, Any]:
         """Create a summary of processing results."""
         summary = {
@@ -209,9 +631,7 @@ class MasterAgent:
             "step_details": {}
         }
         
-        steps = ["transcription", "noise_analysis", "evaluation", "summary", "recommendations"]
-        
-        for step in steps:
+        for step in PIPELINE_STEPS:
             if step in result["results"]:
                 step_result = result["results"][step]
                 if step_result.get("status") == "success":
@@ -228,45 +648,37 @@ class MasterAgent:
     
     def _create_batch_summary(self, batch_result: Dict[str, Any]) -> Dict[str, Any]:
         """Create a summary of batch processing."""
-        step_counts = {
-            "transcription": {"success": 0, "failed": 0},
-            "noise_analysis": {"success": 0, "failed": 0}, 
-            "evaluation": {"success": 0, "failed": 0},
-            "summary": {"success": 0, "failed": 0},
-            "recommendations": {"success": 0, "failed": 0}
-        }
-        
-        for file_result in batch_result["files"]:
-            for step, counts in step_counts.items():
-                if step in file_result.get("results", {}):
-                    step_result = file_result["results"][step]
-                    if step_result.get("status") == "success":
-                        counts["success"] += 1
-                    else:
-                        counts["failed"] += 1
-                else:
-                    counts["failed"] += 1
+        # Single pass over every file's step results; missing steps count as failures
+        successes = Counter(
+            step
+            for file_result in batch_result["files"]
+            for step, step_result in file_result.get("results", {}).items()
+            if step_result.get("status") == "success"
+        )
         
         return {
             "total_files": batch_result["total_files"],
             "successful_files": batch_result["successful_files"],
             "failed_files": batch_result["failed_files"],
             "step_success_rates": {
-                step: f"{counts['success']}/{batch_result['total_files']}" 
-                for step, counts in step_counts.items()
+                step: f"{successes[step]}/{batch_result['total_files']}"
+                for step in PIPELINE_STEPS
             }
         }
     
-    def _cleanup_temp_files(self):
-        """Clean up temporary files."""
-        for temp_file in self.temp_files:
+    def _cleanup_temp_files(self, paths: Optional[List[str]] = None):
+        """Clean up temporary files (all tracked files if no paths are given)."""
+        with self._temp_files_lock:
+            targets = set(self.temp_files if paths is None else paths)
+            self.temp_files = [path for path in self.temp_files if path not in targets]
+        
+        for temp_file in targets:
             try:
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-            except Exception as e:
+                os.unlink(temp_file)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
                 print(f"Warning: Could not clean up temp file {temp_file}: {e}")
-        
-        self.temp_files = []
     
     def save_results_to_json(self, results: Dict[str, Any], filename: Optional[str] = None):
         """Save processing results to JSON file."""
@@ -277,8 +689,11 @@ class MasterAgent:
         output_path = OUTPUTS_DIR / filename
         
         try:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
+            with open(output_path, 'wb') as f:
+                f.write(orjson.dumps(
+                    results,
+                    option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+                ))
             
             print(f"💾 Results saved to: {output_path}")
             return str(output_path)
@@ -294,12 +709,24 @@ def process_single_audio(audio_url: str, custom_prompt: Optional[str] = None) ->
     return agent.process_audio_file(audio_url, custom_prompt)
 
 
+async def process_single_audio_async(audio_url: str, custom_prompt: Optional[str] = None) -> Dict[str, Any]:
+    """Async variant of process_single_audio for callers already running an event loop."""
+    agent = MasterAgent()
+    return await agent.process_audio_file_async(audio_url, custom_prompt)
+
+
 def process_multiple_audios(audio_urls: List[str], custom_prompt: Optional[str] = None) -> Dict[str, Any]:
     """Convenience function to process multiple audio files."""
     agent = MasterAgent()
     return agent.process_multiple_files(audio_urls, custom_prompt)
 
 
+def process_multiple_audios_batch(audio_urls: List[str], custom_prompt: Optional[str] = None) -> Dict[str, Any]:
+    """Convenience function to process multiple audio files through the OpenAI Batch API."""
+    agent = MasterAgent()
+    return agent.process_multiple_files_batch(audio_urls, custom_prompt)
+
+
 if __name__ == "__main__":
     # Test master agent
     print("Testing Master Agent...")
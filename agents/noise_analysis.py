@@ -1,14 +1,128 @@
 # Noise Analysis Agent for Audio Quality Assessment
 import os
+import math
 import wave
-import json
+import struct
+import asyncio
+import orjson
 import numpy as np
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, Any, Optional
 
-from config.settings import get_file_path
+from config.settings import get_file_path, NOISE_BLOCK_SAMPLES, SILENCE_PEAK_RATIO
 from utils.helpers import get_audio_file_identifier, validate_audio_file, format_duration
 
+# numpy dtypes for the PCM sample widths we analyze (in bytes)
+_SAMPLE_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+def _find_wav_data_offset(f) -> int:
+    """Return the byte offset of the PCM samples in a RIFF/WAVE file."""
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        raise ValueError("Not a RIFF/WAVE file")
+    
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            raise ValueError("WAV file has no data chunk")
+        chunk_id = chunk_header[:4]
+        chunk_size = struct.unpack('<I', chunk_header[4:])[0]
+        if chunk_id == b'data':
+            return f.tell()
+        # Chunks are padded to an even size
+        f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+def _silent_peak(audio_data: np.ndarray, probe_size: int, threshold: float) -> Optional[int]:
+    """Return the peak amplitude if no sample reaches threshold, else None.
+    
+    The first probe_size samples are checked first; only if they are quiet is the rest
+    scanned, block by block, stopping at the first loud block.
+    """
+    bounds = [0, probe_size] + list(range(probe_size + NOISE_BLOCK_SAMPLES, len(audio_data), NOISE_BLOCK_SAMPLES))
+    bounds.append(len(audio_data))
+    peak = 0
+    for start, end in zip(bounds, bounds[1:]):
+        block = audio_data[start:end]
+        if len(block):
+            peak = max(peak, -int(block.min()), int(block.max()))
+            if peak >= threshold:
+                return None
+    return peak
+
+def _fused_stats(audio_data: np.ndarray, segment_size: int, clip_threshold: float, scale: float):
+    """Compute the noise metrics' raw statistics in one pass over cache-sized blocks.
+    
+    Returns (sum of squares, peak amplitude, clipped sample count, zero crossings,
+    per-segment mean power). Each block is scaled into a reused float32 buffer in one
+    fused cast-and-multiply, so the full signal is never materialized as floats; the
+    sum of squares and segment powers are in those scaled units, the peak is raw.
+    """
+    # Blocks hold whole segments so no segment straddles two blocks
+    block_size = max(1, NOISE_BLOCK_SAMPLES // segment_size) * segment_size
+    
+    sum_sq = 0.0
+    low, high = 0, 0
+    clipped = 0
+    zero_crossings = 0
+    # Blocks hold whole segments, so every segment's power lands in one preallocated array
+    segment_powers = np.empty(len(audio_data) // segment_size, dtype=np.float32)
+    segments_done = 0
+    previous_negative = None
+    
+    # Integer samples reach the threshold in magnitude exactly when they reach its ceiling,
+    # so clipping is tested with integer compares in the source dtype (no abs temporary)
+    clip_level = math.ceil(clip_threshold)
+    
+    # Scratch buffers reused by every block. Zero crossings compare one-byte sign masks,
+    # which SIMD loops process several times more lanes of than the wider samples
+    sign_buffer = np.empty(block_size, dtype=bool)
+    mask_buffer = np.empty(block_size, dtype=bool)
+    float_buffer = np.empty(block_size, dtype=np.float32)
+    
+    for start in range(0, len(audio_data), block_size):
+        block = audio_data[start:start + block_size]
+        
+        block_low, block_high = int(block.min()), int(block.max())
+        low = min(low, block_low)
+        high = max(high, block_high)
+        # The block's range already rules out clipping in the common case
+        if block_high >= clip_level or block_low <= -clip_level:
+            mask = mask_buffer[:len(block)]
+            np.greater_equal(block, clip_level, out=mask)
+            clipped += int(np.count_nonzero(mask))
+            np.less_equal(block, -clip_level, out=mask)
+            clipped += int(np.count_nonzero(mask))
+        
+        pairs = len(block) - 1
+        signs = sign_buffer[:len(block)]
+        np.less(block, 0, out=signs)
+        np.not_equal(signs[1:], signs[:-1], out=mask_buffer[:pairs])
+        zero_crossings += int(np.count_nonzero(mask_buffer[:pairs]))
+        if previous_negative is not None and bool(signs[0]) != previous_negative:
+            zero_crossings += 1
+        previous_negative = bool(signs[-1])
+        
+        samples = float_buffer[:len(block)]
+        np.multiply(block, scale, out=samples, casting='unsafe')
+        
+        # einsum fuses square and sum per segment without a squared temporary, writing
+        # straight into segment_powers; copy=False guarantees the segments are a view
+        full_segments = len(block) // segment_size
+        segmented = full_segments * segment_size
+        if full_segments:
+            segments = np.reshape(samples[:segmented], (full_segments, segment_size), copy=False)
+            segment_sums = segment_powers[segments_done:segments_done + full_segments]
+            np.einsum('ij,ij->i', segments, segments, out=segment_sums)
+            sum_sq += float(segment_sums.sum(dtype=np.float64))
+            segment_sums *= np.float32(1.0 / segment_size)
+            segments_done += full_segments
+        if segmented < len(block):
+            tail = samples[segmented:]
+            sum_sq += float(np.dot(tail, tail))
+    
+    return sum_sq, max(-low, high), clipped, zero_crossings, segment_powers
+
 class NoiseAnalysisAgent:
     """Analyzes audio quality and noise levels in call recordings."""
     
@@ -26,12 +140,9 @@ class NoiseAnalysisAgent:
         file_id = get_audio_file_identifier(audio_url, audio_path)
         
         try:
-            # Basic audio analysis
-            audio_stats = self._extract_audio_stats(audio_path)
-            audio_stats['audio_path'] = audio_path  # Add path for quality metrics calculation
-
-            # Calculate quality metrics
-            quality_metrics = self._calculate_quality_metrics(audio_stats)
+            # Basic audio analysis and quality metrics (reused if this file was just analyzed)
+            audio_stats, quality_metrics = _measure_audio(audio_path)
+            audio_stats['audio_path'] = audio_path
             
             # Generate noise report
             noise_report = self._generate_noise_report(quality_metrics, audio_stats, file_id)
@@ -60,7 +171,7 @@ class NoiseAnalysisAgent:
         """Extract basic audio statistics."""
         try:
             with wave.open(audio_path, 'rb') as wav_file:
-                # Get basic properties
+                # Get basic properties (the header is enough; samples are read in the metrics pass)
                 frames = wav_file.getnframes()
                 sample_rate = wav_file.getframerate()
                 channels = wav_file.getnchannels()
@@ -69,21 +180,6 @@ class NoiseAnalysisAgent:
                 # Calculate duration
                 duration = frames / sample_rate
                 
-                # Read audio data for analysis
-                raw_data = wav_file.readframes(frames)
-                
-                # Convert to numpy array
-                if sample_width == 1:
-                    audio_data = np.frombuffer(raw_data, dtype=np.int8)
-                elif sample_width == 2:
-                    audio_data = np.frombuffer(raw_data, dtype=np.int16)
-                else:
-                    audio_data = np.frombuffer(raw_data, dtype=np.int32)
-                
-                # Handle stereo by taking first channel
-                if channels > 1:
-                    audio_data = audio_data[::channels]
-                
                 return {
                     "sample_rate": sample_rate,
                     "channels": channels,
@@ -96,55 +192,70 @@ class NoiseAnalysisAgent:
         except Exception as e:
             raise Exception(f"Failed to extract audio stats: {str(e)}")
     
-    def _calculate_quality_metrics(self, audio_stats: Dict[str, Any]) -> Dict[str, Any]:
-        """Calculate audio quality metrics."""
+    def _load_first_channel(self, audio_path: str) -> np.ndarray:
+        """Map the WAV's PCM samples from disk and return the first channel.
+        
+        Mono files are returned as the memory map itself; multi-channel files get one
+        contiguous copy of the first channel (in the source integer dtype).
+        """
+        with wave.open(audio_path, 'rb') as wav_file:
+            frames = wav_file.getnframes()
+            channels = wav_file.getnchannels()
+            sample_width = wav_file.getsampwidth()
+        
+        if sample_width not in _SAMPLE_DTYPES:
+            raise ValueError(f"Unsupported sample width: {sample_width * 8} bits")
+        
+        with open(audio_path, 'rb') as f:
+            data_offset = _find_wav_data_offset(f)
+        
+        # Truncated files hold fewer samples than the header claims
+        available = (os.path.getsize(audio_path) - data_offset) // sample_width
+        sample_count = min(frames * channels, available - available % channels)
+        
+        audio_data = np.memmap(audio_path, dtype=_SAMPLE_DTYPES[sample_width], mode='r',
+                               offset=data_offset, shape=(sample_count,))
+        
+        # Handle stereo by taking first channel, packed into a unit-stride buffer so the
+        # integer reductions and float conversion downstream run on contiguous memory
+        if channels > 1:
+            audio_data = np.ascontiguousarray(audio_data.reshape(-1, channels)[:, 0])
+        
+        return audio_data
+    
+    def _calculate_quality_metrics(self, audio_stats: Dict[str, Any], audio_data: np.ndarray) -> Dict[str, Any]:
+        """Calculate audio quality metrics from the first channel's samples."""
         try:
-            # Extract audio data for calculations
-            audio_path = audio_stats.get('audio_path')
-            if not audio_path:
-                raise Exception("Audio path not provided for quality metrics calculation")
-
-            with wave.open(audio_path, 'rb') as wav_file:
-                frames = wav_file.getnframes()
-                sample_width = wav_file.getsampwidth()
-                channels = wav_file.getnchannels()
-                raw_data = wav_file.readframes(frames)
-
-                # Convert to numpy array
-                if sample_width == 1:
-                    audio_data = np.frombuffer(raw_data, dtype=np.int8)
-                elif sample_width == 2:
-                    audio_data = np.frombuffer(raw_data, dtype=np.int16)
-                else:
-                    audio_data = np.frombuffer(raw_data, dtype=np.int32)
-
-                # Handle stereo by taking first channel
-                if channels > 1:
-                    audio_data = audio_data[::channels]
-
             sample_rate = audio_stats['sample_rate']
             
-            # Convert to float for calculations
-            audio_float = audio_data.astype(np.float64)
-            
-            # Calculate RMS (Root Mean Square) - measure of signal power
-            rms = np.sqrt(np.mean(audio_float ** 2))
-            
-            # Calculate peak amplitude
-            peak_amplitude = np.max(np.abs(audio_float))
-            
             # Estimate SNR (Signal-to-Noise Ratio) - simplified approach
             # Split audio into segments and analyze variance
             segment_size = sample_rate // 4  # 0.25 second segments
-            num_segments = len(audio_float) // segment_size
             
-            if num_segments > 4:
-                segments = audio_float[:num_segments * segment_size].reshape(num_segments, segment_size)
-                segment_powers = np.mean(segments ** 2, axis=1)
-                
-                # Assume quiet segments represent noise floor
-                noise_floor = np.percentile(segment_powers, 25)  # Bottom 25%
-                signal_power = np.percentile(segment_powers, 75)  # Top 25%
+            # Detect clipping (values at maximum)
+            max_value = 2 ** (audio_stats['sample_width'] * 8 - 1) - 1
+            # Levels are reported as a fraction of full scale so they compare across bit depths
+            full_scale = max_value + 1
+            
+            # Silent recordings (dropped calls, dead lines) skip the full metrics pass
+            silent_peak = _silent_peak(audio_data, sample_rate, max_value * SILENCE_PEAK_RATIO)
+            if silent_peak is not None:
+                return self._silent_metrics(silent_peak / full_scale, audio_stats)
+            
+            # One blocked pass over the samples gathers every statistic below
+            sum_sq, peak_amplitude, clipped, zero_crossings, segment_powers = _fused_stats(
+                audio_data, segment_size, max_value * 0.99, np.float32(1.0 / full_scale)
+            )
+            peak_amplitude /= full_scale
+            sample_count = len(audio_data)
+            
+            # Calculate RMS (Root Mean Square) - measure of signal power
+            rms = np.sqrt(sum_sq / sample_count)
+            
+            if len(segment_powers) > 4:
+                # Assume quiet segments represent noise floor (bottom 25%) and loud ones
+                # signal (top 25%); one call partitions the powers once for both
+                noise_floor, signal_power = np.percentile(segment_powers, [25, 75])
                 
                 # Calculate SNR in dB
                 if noise_floor > 0:
@@ -157,13 +268,10 @@ class NoiseAnalysisAgent:
             # Calculate dynamic range
             dynamic_range = 20 * np.log10(peak_amplitude / (rms + 1e-10))
             
-            # Detect clipping (values at maximum)
-            max_value = 2 ** (audio_stats['sample_width'] * 8 - 1) - 1
-            clipping_percentage = np.sum(np.abs(audio_data) >= max_value * 0.99) / len(audio_data) * 100
+            clipping_percentage = clipped / sample_count * 100
             
             # Calculate zero crossing rate (indicates speech vs noise)
-            zero_crossings = np.sum(np.diff(np.signbit(audio_float)))
-            zcr = zero_crossings / len(audio_float)
+            zcr = zero_crossings / sample_count
             
             return {
                 "rms": float(rms),
@@ -179,6 +287,20 @@ class NoiseAnalysisAgent:
         except Exception as e:
             raise Exception(f"Failed to calculate quality metrics: {str(e)}")
     
+    def _silent_metrics(self, peak_amplitude: float, audio_stats: Dict[str, Any]) -> Dict[str, Any]:
+        """Fixed quality metrics for a recording with no usable signal."""
+        return {
+            "rms": 0.0,
+            "peak_amplitude": float(peak_amplitude),
+            "snr_db": 0.0,
+            "dynamic_range_db": 0.0,
+            "clipping_percentage": 0.0,
+            "zero_crossing_rate": 0.0,
+            "sample_rate": audio_stats['sample_rate'],
+            "duration": audio_stats['duration'],
+            "silent": True
+        }
+    
     def _generate_noise_report(self, metrics: Dict[str, Any], audio_stats: Dict[str, Any], 
                              file_id: str) -> Dict[str, Any]:
         """Generate comprehensive noise analysis report."""
@@ -188,7 +310,10 @@ class NoiseAnalysisAgent:
         clipping = metrics['clipping_percentage']
         
         # Quality classification
-        if snr >= 25 and clipping < 1:
+        if metrics.get('silent'):
+            quality_label = "Silent"
+            quality_score = 1
+        elif snr >= 25 and clipping < 1:
             quality_label = "Excellent"
             quality_score = 9 + min(1, (snr - 25) / 10)
         elif snr >= 20 and clipping < 3:
@@ -206,12 +331,15 @@ class NoiseAnalysisAgent:
         
         # Generate recommendations
         recommendations = []
-        if snr < 20:
-            recommendations.append("Consider noise reduction preprocessing")
-        if clipping > 2:
-            recommendations.append("Audio has clipping - check recording levels")
-        if metrics['dynamic_range_db'] < 20:
-            recommendations.append("Low dynamic range - may indicate compression issues")
+        if metrics.get('silent'):
+            recommendations.append("Recording is silent - check the call connection or recording setup")
+        else:
+            if snr < 20:
+                recommendations.append("Consider noise reduction preprocessing")
+            if clipping > 2:
+                recommendations.append("Audio has clipping - check recording levels")
+            if metrics['dynamic_range_db'] < 20:
+                recommendations.append("Low dynamic range - may indicate compression issues")
         if not recommendations:
             recommendations.append("Audio quality is acceptable for processing")
         
@@ -227,8 +355,8 @@ class NoiseAnalysisAgent:
             },
             "detailed_metrics": {
                 "signal_to_noise_ratio_db": round(metrics['snr_db'], 2),
-                "rms_level": round(metrics['rms'], 2),
-                "peak_amplitude": round(metrics['peak_amplitude'], 2),
+                "rms_level": round(metrics['rms'], 4),
+                "peak_amplitude": round(metrics['peak_amplitude'], 4),
                 "dynamic_range_db": round(metrics['dynamic_range_db'], 2),
                 "clipping_percentage": round(clipping, 2),
                 "zero_crossing_rate": round(metrics['zero_crossing_rate'], 4)
@@ -256,8 +384,33 @@ class NoiseAnalysisAgent:
             }
         }
         
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(report_with_metadata, f, indent=2, ensure_ascii=False)
+        with open(json_path, 'wb') as f:
+            f.write(orjson.dumps(
+                report_with_metadata,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            ))
+
+
+def _measure_audio(audio_path: str):
+    """Get (audio_stats, quality_metrics) for a file, cached while it is unchanged."""
+    stat = os.stat(audio_path)
+    audio_stats, quality_metrics = _measure_audio_cached(
+        os.path.abspath(audio_path), stat.st_mtime_ns, stat.st_size
+    )
+    # Callers get their own copies so the cached dicts are never mutated
+    return dict(audio_stats), dict(quality_metrics)
+
+@lru_cache(maxsize=16)
+def _measure_audio_cached(audio_path: str, mtime_ns: int, size: int):
+    """Measure a file; the stat fields make rewritten files miss the cache.
+    
+    Only the scalar results are cached; the samples are released on return.
+    """
+    agent = NoiseAnalysisAgent()
+    audio_stats = agent._extract_audio_stats(audio_path)
+    # The samples are passed separately so the stats stay metadata-only
+    audio_data = agent._load_first_channel(audio_path)
+    return audio_stats, agent._calculate_quality_metrics(audio_stats, audio_data)
 
 
 def process_noise_analysis(audio_path: str, audio_url: Optional[str] = None) -> Dict[str, Any]:
@@ -266,6 +419,11 @@ def process_noise_analysis(audio_path: str, audio_url: Optional[str] = None) ->
     return agent.analyze_audio_quality(audio_path, audio_url)
 
 
+async def process_noise_analysis_async(audio_path: str, audio_url: Optional[str] = None) -> Dict[str, Any]:
+    """Run noise analysis in a worker thread so it overlaps with OpenAI calls."""
+    return await asyncio.to_thread(process_noise_analysis, audio_path, audio_url)
+
+
 if __name__ == "__main__":
     # Test noise analysis agent
     print("Testing Noise Analysis Agent...")
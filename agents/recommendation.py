@@ -1,16 +1,44 @@
 # Recommendation Agent for Call Center Process Improvement
 import os
+import re
 import json
+import orjson
 from datetime import datetime
-from openai import OpenAI
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 from config.settings import (
-    load_env_variable, ENV_VARS, OPENAI_MODELS,
+    OPENAI_MODELS,
     TEMPERATURE_SETTINGS, MAX_TOKEN_LIMITS, SYSTEM_PROMPTS,
     get_file_path
 )
-from utils.helpers import get_audio_file_identifier, clean_text_for_processing
+from utils.helpers import get_audio_file_identifier, load_clean_transcript
+from utils.openai_client import (
+    get_openai_client, get_async_openai_client, check_prompt_budget, acheck_prompt_budget,
+    create_chat_completion, acreate_chat_completion
+)
+
+# Keys of parsed_recommendations, in report order
+RECOMMENDATION_CATEGORIES = (
+    "high_priority",
+    "medium_priority",
+    "low_priority",
+    "communication_improvements",
+    "process_improvements",
+    "training_recommendations",
+    "system_improvements"
+)
+
+# "priority" and "category" values of each recommendation the model returns, mapped to those keys
+PRIORITY_KEYS = {"high": "high_priority", "medium": "medium_priority", "low": "low_priority"}
+FOCUS_AREA_KEYS = {
+    "communication": "communication_improvements",
+    "process": "process_improvements",
+    "training": "training_recommendations",
+    "system": "system_improvements"
+}
+
+# Complete {...} items left in a reply that was cut off mid-list
+_ITEM_OBJECT_PATTERN = re.compile(r'\{[^{}]*\}')
 
 class RecommendationAgent:
     """Generates actionable recommendations for call center improvement."""
@@ -20,98 +48,82 @@ class RecommendationAgent:
         self.initialize_openai()
     
     def initialize_openai(self):
-        """Initialize OpenAI client."""
-        api_key = load_env_variable(ENV_VARS['OPENAI_API_KEY'], required=True)
-        if api_key:
-            self.client = OpenAI(api_key=api_key)
-            print("✅ OpenAI client initialized for recommendations")
-        else:
-            print("⚠️  OpenAI API key not found")
+        """Attach the shared OpenAI client."""
+        self.client = get_openai_client()
+        print("✅ OpenAI client initialized for recommendations")
     
     def generate_recommendations(self, transcript_path: str, evaluation_json_path: Optional[str] = None, 
                                audio_url: Optional[str] = None) -> Dict[str, Any]:
         """Generate recommendations based on transcript and optional evaluation."""
-        if not self.client:
-            return {
-                "status": "error",
-                "error_message": "OpenAI client not initialized"
-            }
-        
-        if not os.path.exists(transcript_path):
-            return {
-                "status": "error",
-                "error_message": f"Transcript file not found: {transcript_path}"
-            }
+        error = self._validate_inputs(self.client, transcript_path)
+        if error:
+            return error
         
         file_id = get_audio_file_identifier(audio_url, transcript_path)
         
         try:
-            # Read transcript
-            with open(transcript_path, 'r', encoding='utf-8') as f:
-                transcript = f.read()
-            
-            if not transcript.strip():
+            transcript = self._load_transcript(transcript_path)
+            if not transcript:
                 return {
                     "status": "error",
                     "error_message": "Transcript is empty"
                 }
             
-            transcript = clean_text_for_processing(transcript)
-            
-            # Read evaluation data if available
-            evaluation_context = ""
-            if evaluation_json_path and os.path.exists(evaluation_json_path):
-                try:
-                    with open(evaluation_json_path, 'r', encoding='utf-8') as f:
-                        evaluation_data = json.load(f)
-                    evaluation_context = f"\n\nEvaluation Results:\n{json.dumps(evaluation_data, indent=2, ensure_ascii=False)}"
-                except Exception as e:
-                    print(f"Warning: Could not read evaluation file: {e}")
+            budget_error = check_prompt_budget(transcript, OPENAI_MODELS['RECOMMENDATION'])
+            if budget_error:
+                return {
+                    "status": "error",
+                    "file_identifier": file_id,
+                    "error_message": budget_error
+                }
             
             # Generate recommendations using OpenAI
-            user_content = f"Please provide recommendations for improvement based on this call center transcript:{evaluation_context}\n\nTranscript:\n{transcript}"
-            
-            messages = [
-                {"role": "system", "content": SYSTEM_PROMPTS['RECOMMENDATION']},
-                {"role": "user", "content": user_content}
-            ]
-            
-            response = self.client.chat.completions.create(
-                model=OPENAI_MODELS['RECOMMENDATION'],
-                messages=messages,
-                temperature=TEMPERATURE_SETTINGS['RECOMMENDATION'],
-                max_tokens=MAX_TOKEN_LIMITS['RECOMMENDATION']
+            content, usage, cache_hit = create_chat_completion(
+                self.client, self._build_request(transcript, evaluation_json_path)
             )
             
-            recommendations = response.choices[0].message.content
-            if not recommendations:
+            return self._build_result(content, usage, file_id, audio_url, transcript_path,
+                                      evaluation_json_path, cache_hit)
+            
+        except Exception as e:
+            return {
+                "status": "error",
+                "file_identifier": file_id,
+                "error_message": f"Recommendations generation failed: {str(e)}"
+            }
+    
+    async def generate_recommendations_async(self, transcript_path: str, evaluation_json_path: Optional[str] = None,
+                                             audio_url: Optional[str] = None) -> Dict[str, Any]:
+        """Generate recommendations without blocking the event loop."""
+        error = self._validate_inputs(self.client, transcript_path)
+        if error:
+            return error
+        
+        file_id = get_audio_file_identifier(audio_url, transcript_path)
+        
+        try:
+            transcript = self._load_transcript(transcript_path)
+            if not transcript:
                 return {
                     "status": "error",
-                    "error_message": "OpenAI returned empty recommendations"
+                    "error_message": "Transcript is empty"
                 }
             
-            # Parse recommendations into structured format
-            parsed_recommendations = self._parse_recommendations(recommendations)
+            budget_error = await acheck_prompt_budget(transcript, OPENAI_MODELS['RECOMMENDATION'])
+            if budget_error:
+                return {
+                    "status": "error",
+                    "file_identifier": file_id,
+                    "error_message": budget_error
+                }
             
-            # Save recommendations to file
-            recommendations_path = get_file_path('RECOMMENDATIONS', file_id)
-            self._save_recommendations_report(recommendations_path, recommendations, parsed_recommendations,
-                                            file_id, audio_url, transcript_path, evaluation_json_path)
+            # Generate recommendations using OpenAI
+            content, usage, cache_hit = await acreate_chat_completion(
+                get_async_openai_client(), self._build_request(transcript, evaluation_json_path)
+            )
             
-            return {
-                "status": "success",
-                "file_identifier": file_id,
-                "recommendations": recommendations,
-                "parsed_recommendations": parsed_recommendations,
-                "recommendations_path": str(recommendations_path),
-                "model_used": OPENAI_MODELS['RECOMMENDATION'],
-                "evaluation_used": evaluation_json_path is not None and os.path.exists(evaluation_json_path or ""),
-                "token_usage": {
-                    "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
-                    "completion_tokens": response.usage.completion_tokens if response.usage else 0,
-                    "total_tokens": response.usage.total_tokens if response.usage else 0
-                }
-            }
+            return self._build_result(content, usage, file_id, audio_url, transcript_path,
+                                      evaluation_json_path, cache_hit)
             
         except Exception as e:
             return {
@@ -120,18 +132,157 @@ class RecommendationAgent:
                 "error_message": f"Recommendations generation failed: {str(e)}"
             }
     
-    def _parse_recommendations(self, recommendations_text: str) -> Dict[str, Any]:
-        """Parse recommendations text into structured categories."""
-        # Simple parsing based on common patterns
-        categories = {
-            "high_priority": [],
-            "medium_priority": [],
-            "low_priority": [],
-            "communication_improvements": [],
-            "process_improvements": [],
-            "training_recommendations": [],
-            "system_improvements": []
+    def _validate_inputs(self, client, transcript_path: str) -> Optional[Dict[str, Any]]:
+        """Return an error result if recommendations cannot be generated, otherwise None."""
+        if not client:
+            return {
+                "status": "error",
+                "error_message": "OpenAI client not initialized"
+            }
+        
+        if not os.path.exists(transcript_path):
+            return {
+                "status": "error",
+                "error_message": f"Transcript file not found: {transcript_path}"
+            }
+        
+        return None
+    
+    def _load_transcript(self, transcript_path: str) -> str:
+        """Read and clean the transcript; returns an empty string if there is no content."""
+        # Shared cache: the summary and recommendation agents read the same transcript.
+        # Whitespace-only transcripts clean down to an empty string
+        return load_clean_transcript(transcript_path)
+    
+    def _build_request(self, transcript: str, evaluation_json_path: Optional[str] = None) -> Dict[str, Any]:
+        """Build the chat completion request parameters, including evaluation context if available."""
+        evaluation_context = ""
+        if evaluation_json_path and os.path.exists(evaluation_json_path):
+            try:
+                with open(evaluation_json_path, 'r', encoding='utf-8') as f:
+                    evaluation_data = json.load(f)
+                evaluation_context = f"\n\nEvaluation Results:\n{json.dumps(evaluation_data, indent=2, ensure_ascii=False)}"
+            except Exception as e:
+                print(f"Warning: Could not read evaluation file: {e}")
+        
+        user_content = f"Please provide recommendations for improvement based on this call center transcript:{evaluation_context}\n\nTranscript:\n{transcript}"
+        
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPTS['RECOMMENDATION']},
+            {"role": "user", "content": user_content}
+        ]
+        
+        return {
+            "model": OPENAI_MODELS['RECOMMENDATION'],
+            "messages": messages,
+            "temperature": TEMPERATURE_SETTINGS['RECOMMENDATION'],
+            "max_tokens": MAX_TOKEN_LIMITS['RECOMMENDATION'],
+            "response_format": {"type": "json_object"}
+        }
+    
+    def _build_result(self, recommendations: Optional[str], usage, file_id: str, audio_url: Optional[str],
+                      transcript_path: str, evaluation_json_path: Optional[str],
+                      cache_hit: bool = False) -> Dict[str, Any]:
+        """Parse and save the generated recommendations and build the result."""
+        if not recommendations:
+            return {
+                "status": "error",
+                "error_message": "OpenAI returned empty recommendations"
+            }
+        
+        # The model answers with a JSON list of recommendations; a reply cut off at
+        # max_tokens keeps its complete items, and anything else falls back to the text parser
+        items = self._load_recommendation_items(recommendations)
+        if items is not None:
+            parsed_recommendations = self._parse_recommendations(items)
+            recommendations = self._format_recommendations_text(items)
+        else:
+            parsed_recommendations = self._parse_recommendations_text(recommendations)
+        
+        # Save recommendations to file
+        recommendations_path = get_file_path('RECOMMENDATIONS', file_id)
+        self._save_recommendations_report(recommendations_path, recommendations,
+                                        file_id, audio_url, transcript_path, evaluation_json_path)
+        
+        return {
+            "status": "success",
+            "file_identifier": file_id,
+            "recommendations": recommendations,
+            "parsed_recommendations": parsed_recommendations,
+            "recommendations_path": str(recommendations_path),
+            "model_used": OPENAI_MODELS['RECOMMENDATION'],
+            "evaluation_used": evaluation_json_path is not None and os.path.exists(evaluation_json_path or ""),
+            "cache_hit": cache_hit,
+            "token_usage": {
+                "prompt_tokens": usage.prompt_tokens if usage else 0,
+                "completion_tokens": usage.completion_tokens if usage else 0,
+                "total_tokens": usage.total_tokens if usage else 0
+            }
         }
+    
+    def _load_recommendation_items(self, content: str) -> Optional[List[Dict[str, str]]]:
+        """Read the model's recommendation items, salvaging complete ones from a truncated reply.
+        
+        Returns None if the content holds no usable recommendation list.
+        """
+        try:
+            data = orjson.loads(content)
+            raw_items = data.get("recommendations") if isinstance(data, dict) else None
+        except orjson.JSONDecodeError:
+            raw_items = []
+            for match in _ITEM_OBJECT_PATTERN.finditer(content):
+                try:
+                    raw_items.append(orjson.loads(match.group()))
+                except orjson.JSONDecodeError:
+                    continue
+            raw_items = raw_items or None
+        
+        if not isinstance(raw_items, list):
+            return None
+        
+        items = []
+        for item in raw_items:
+            if not isinstance(item, dict):
+                continue
+            text = str(item.get("text") or "").strip()
+            if text:
+                items.append({
+                    "text": text,
+                    "priority": str(item.get("priority") or "").strip().lower(),
+                    "category": str(item.get("category") or "").strip().lower()
+                })
+        return items
+    
+    def _parse_recommendations(self, items: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Group recommendation items both by priority and by focus area."""
+        categories = {category: [] for category in RECOMMENDATION_CATEGORIES}
+        for item in items:
+            # Items without a valid priority are treated as medium priority
+            categories[PRIORITY_KEYS.get(item["priority"], "medium_priority")].append(item["text"])
+            if item["category"] in FOCUS_AREA_KEYS:
+                categories[FOCUS_AREA_KEYS[item["category"]]].append(item["text"])
+        return categories
+    
+    def _format_recommendations_text(self, items: List[Dict[str, str]]) -> str:
+        """Render recommendation items as readable text, each once under its priority."""
+        sections = []
+        for priority, key in PRIORITY_KEYS.items():
+            lines = []
+            for item in items:
+                if PRIORITY_KEYS.get(item["priority"], "medium_priority") != key:
+                    continue
+                focus_area = FOCUS_AREA_KEYS.get(item["category"])
+                tag = f" ({focus_area.replace('_', ' ').title()})" if focus_area else ""
+                lines.append(f"• {item['text']}{tag}")
+            if lines:
+                category_title = key.replace('_', ' ').title()
+                sections.append("\n".join([f"{category_title}:", "-" * len(category_title) + ":"] + lines))
+        return "\n\n".join(sections)
+    
+    def _parse_recommendations_text(self, recommendations_text: str) -> Dict[str, Any]:
+        """Parse free-text recommendations into structured categories (fallback for non-JSON replies)."""
+        # Simple parsing based on common patterns
+        categories = {category: [] for category in RECOMMENDATION_CATEGORIES}
         
         lines = recommendations_text.split('\n')
         current_category = "general"
@@ -168,8 +319,7 @@ class RecommendationAgent:
         
         return categories
     
-    def _save_recommendations_report(self, file_path: str, recommendations: str, 
-                                   parsed_recommendations: dict, file_id: str,
+    def _save_recommendations_report(self, file_path: str, recommendations: str, file_id: str,
                                    audio_url: Optional[str], transcript_path: str,
                                    evaluation_json_path: Optional[str]):
         """Save formatted recommendations report."""
@@ -181,36 +331,39 @@ Evaluation File: {os.path.basename(evaluation_json_path) if evaluation_json_path
 Generated on: {datetime.now().isoformat()}
 =======================================================
 
-ORIGINAL RECOMMENDATIONS:
-{recommendations}
-
 STRUCTURED RECOMMENDATIONS:
 =========================
 
 """
         
-        # Add structured recommendations
-        structured_content = ""
-        for category, items in parsed_recommendations.items():
-            if items:
-                category_title = category.replace('_', ' ').title()
-                structured_content += f"{category_title}:\n"
-                structured_content += "-" * len(category_title) + ":\n"
-                for item in items:
-                    structured_content += f"• {item}\n"
-                structured_content += "\n"
-        
         with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(header + structured_content)
+            f.write(header + recommendations + "\n")
+
+
+_agent = None
+
+def _get_agent() -> RecommendationAgent:
+    """Get the module's shared RecommendationAgent; agents hold no per-call state."""
+    global _agent
+    if _agent is None:
+        _agent = RecommendationAgent()
+    return _agent
 
 
 def process_recommendations(transcript_path: str, evaluation_json_path: Optional[str] = None,
                           audio_url: Optional[str] = None) -> Dict[str, Any]:
     """Main function to process recommendations generation."""
-    agent = RecommendationAgent()
+    agent = _get_agent()
     return agent.generate_recommendations(transcript_path, evaluation_json_path, audio_url)
 
 
+async def process_recommendations_async(transcript_path: str, evaluation_json_path: Optional[str] = None,
+                                        audio_url: Optional[str] = None) -> Dict[str, Any]:
+    """Async variant of process_recommendations using the AsyncOpenAI client."""
+    agent = _get_agent()
+    return await agent.generate_recommendations_async(transcript_path, evaluation_json_path, audio_url)
+
+
 if __name__ == "__main__":
     # Test recommendation agent
     print("Testing Recommendation Agent...")
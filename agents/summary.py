@@ -1,15 +1,20 @@
 # Summary Generation Agent
 import os
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
-from openai import OpenAI
 from typing import Dict, Any, Optional
 
 from config.settings import (
-    load_env_variable, ENV_VARS, OPENAI_MODELS,
+    OPENAI_MODELS,
     TEMPERATURE_SETTINGS, MAX_TOKEN_LIMITS, SYSTEM_PROMPTS,
     get_file_path
 )
-from utils.helpers import get_audio_file_identifier, clean_text_for_processing
+from utils.helpers import get_audio_file_identifier, load_clean_transcript
+from utils.openai_client import (
+    get_openai_client, get_async_openai_client, check_prompt_budget, acheck_prompt_budget,
+    create_chat_completion, acreate_chat_completion
+)
 
 class SummaryAgent:
     """Generates professional summaries of call center conversations."""
@@ -19,82 +24,88 @@ class SummaryAgent:
         self.initialize_openai()
     
     def initialize_openai(self):
-        """Initialize OpenAI client."""
-        api_key = load_env_variable(ENV_VARS['OPENAI_API_KEY'], required=True)
-        if api_key:
-            self.client = OpenAI(api_key=api_key)
-            print("✅ OpenAI client initialized for summary generation")
-        else:
-            print("⚠️  OpenAI API key not found")
+        """Attach the shared OpenAI client."""
+        self.client = get_openai_client()
+        print("✅ OpenAI client initialized for summary generation")
     
     def generate_summary(self, transcript_path: str, audio_url: Optional[str] = None) -> Dict[str, Any]:
         """Generate summary from transcript file."""
-        if not self.client:
-            return {
-                "status": "error",
-                "error_message": "OpenAI client not initialized"
-            }
-        
-        # Validate transcript file
-        if not os.path.exists(transcript_path):
-            return {
-                "status": "error", 
-                "error_message": f"Transcript file not found: {transcript_path}"
-            }
+        error = self._validate_inputs(self.client, transcript_path)
+        if error:
+            return error
         
         file_id = get_audio_file_identifier(audio_url, transcript_path)
         
         try:
-            # Read transcript
-            with open(transcript_path, 'r', encoding='utf-8') as f:
-                transcript = f.read()
-            
-            if not transcript.strip():
+            transcript = self._load_transcript(transcript_path)
+            if not transcript:
                 return {
                     "status": "error",
                     "error_message": "Transcript is empty"
                 }
             
-            # Clean transcript
-            transcript = clean_text_for_processing(transcript)
-            
-            # Generate summary using OpenAI
-            messages = [
-                {"role": "system", "content": SYSTEM_PROMPTS['SUMMARY']},
-                {"role": "user", "content": f"Please summarize the following call center transcript in Arabic:\n\n{transcript}"}
-            ]
-            
-            response = self.client.chat.completions.create(
-                model=OPENAI_MODELS['SUMMARY'],
-                messages=messages,
-                temperature=TEMPERATURE_SETTINGS['SUMMARY'],
-                max_tokens=MAX_TOKEN_LIMITS['SUMMARY']
-            )
-            
-            summary = response.choices[0].message.content
-            if not summary:
+            budget_error = check_prompt_budget(transcript, OPENAI_MODELS['SUMMARY'])
+            if budget_error:
                 return {
                     "status": "error",
-                    "error_message": "OpenAI returned empty summary"
+                    "file_identifier": file_id,
+                    "error_message": budget_error
                 }
             
-            # Save summary to file
+            # Generate summary using OpenAI, writing the report as the summary streams in
             summary_path = get_file_path('SUMMARY', file_id)
-            self._save_summary_report(summary_path, summary, file_id, audio_url, transcript_path)
+            header = self._report_header(file_id, audio_url, transcript_path)
+            with self._streamed_report(summary_path, header) as report:
+                content, usage, cache_hit = create_chat_completion(
+                    self.client, self._build_request(transcript), semantic_text=transcript,
+                    on_delta=report.write
+                )
+            
+            return self._build_result(content, usage, file_id, audio_url, transcript_path, cache_hit,
+                                      report_saved=True)
             
+        except Exception as e:
             return {
-                "status": "success",
+                "status": "error",
                 "file_identifier": file_id,
-                "summary": summary,
-                "summary_path": str(summary_path),
-                "summary_length": len(summary),
-                "model_used": OPENAI_MODELS['SUMMARY'],
-                "token_usage": {
-                    "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
-                    "completion_tokens": response.usage.completion_tokens if response.usage else 0,
-                    "total_tokens": response.usage.total_tokens if response.usage else 0
-                }
+                "error_message": f"Summary generation failed: {str(e)}"
             }
+    
+    async def generate_summary_async(self, transcript_path: str, audio_url: Optional[str] = None) -> Dict[str, Any]:
+        """Generate summary from transcript file without blocking the event loop."""
+        error = self._validate_inputs(self.client, transcript_path)
+        if error:
+            return error
+        
+        file_id = get_audio_file_identifier(audio_url, transcript_path)
+        
+        try:
+            transcript = self._load_transcript(transcript_path)
+            if not transcript:
+                return {
+                    "status": "error",
+                    "error_message": "Transcript is empty"
+                }
+            
+            budget_error = await acheck_prompt_budget(transcript, OPENAI_MODELS['SUMMARY'])
+            if budget_error:
+                return {
+                    "status": "error",
+                    "file_identifier": file_id,
+                    "error_message": budget_error
+                }
+            
+            # Generate summary using OpenAI, writing the report as the summary streams in
+            summary_path = get_file_path('SUMMARY', file_id)
+            header = self._report_header(file_id, audio_url, transcript_path)
+            with self._streamed_report(summary_path, header) as report:
+                content, usage, cache_hit = await acreate_chat_completion(
+                    get_async_openai_client(), self._build_request(transcript), semantic_text=transcript,
+                    on_delta=report.write
+                )
+            
+            return self._build_result(content, usage, file_id, audio_url, transcript_path, cache_hit,
+                                      report_saved=True)
             
         except Exception as e:
             return {
@@ -103,10 +114,76 @@ class SummaryAgent:
                 "error_message": f"Summary generation failed: {str(e)}"
             }
     
-    def _save_summary_report(self, file_path: str, summary: str, file_id: str, 
-                           audio_url: Optional[str], transcript_path: str):
-        """Save formatted summary report to file."""
-        header = f"""
+    def _validate_inputs(self, client, transcript_path: str) -> Optional[Dict[str, Any]]:
+        """Return an error result if summary generation cannot run, otherwise None."""
+        if not client:
+            return {
+                "status": "error",
+                "error_message": "OpenAI client not initialized"
+            }
+        
+        # Validate transcript file
+        if not os.path.exists(transcript_path):
+            return {
+                "status": "error", 
+                "error_message": f"Transcript file not found: {transcript_path}"
+            }
+        
+        return None
+    
+    def _load_transcript(self, transcript_path: str) -> str:
+        """Read and clean the transcript; returns an empty string if there is no content."""
+        # Shared cache: the summary and recommendation agents read the same transcript.
+        # Whitespace-only transcripts clean down to an empty string
+        return load_clean_transcript(transcript_path)
+    
+    def _build_request(self, transcript: str) -> Dict[str, Any]:
+        """Build the chat completion request parameters for a transcript."""
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPTS['SUMMARY']},
+            {"role": "user", "content": f"Please summarize the following call center transcript in Arabic:\n\n{transcript}"}
+        ]
+        
+        return {
+            "model": OPENAI_MODELS['SUMMARY'],
+            "messages": messages,
+            "temperature": TEMPERATURE_SETTINGS['SUMMARY'],
+            "max_tokens": MAX_TOKEN_LIMITS['SUMMARY']
+        }
+    
+    def _build_result(self, summary: Optional[str], usage, file_id: str, audio_url: Optional[str],
+                      transcript_path: str, cache_hit: bool = False,
+                      report_saved: bool = False) -> Dict[str, Any]:
+        """Save the generated summary (unless it was streamed to its report) and build the result."""
+        if not summary:
+            return {
+                "status": "error",
+                "error_message": "OpenAI returned empty summary"
+            }
+        
+        # Save summary to file
+        summary_path = get_file_path('SUMMARY', file_id)
+        if not report_saved:
+            self._save_summary_report(summary_path, summary, file_id, audio_url, transcript_path)
+        
+        return {
+            "status": "success",
+            "file_identifier": file_id,
+            "summary": summary,
+            "summary_path": str(summary_path),
+            "summary_length": len(summary),
+            "model_used": OPENAI_MODELS['SUMMARY'],
+            "cache_hit": cache_hit,
+            "token_usage": {
+                "prompt_tokens": usage.prompt_tokens if usage else 0,
+                "completion_tokens": usage.completion_tokens if usage else 0,
+                "total_tokens": usage.total_tokens if usage else 0
+            }
+        }
+    
+    def _report_header(self, file_id: str, audio_url: Optional[str], transcript_path: str) -> str:
+        """Build the header written above the summary in its report file."""
+        return f"""
 Summary Report for: {file_id}
 Audio URL: {audio_url or 'N/A'}
 Transcript File: {os.path.basename(transcript_path)}
@@ -114,16 +191,58 @@ Generated on: {datetime.now().isoformat()}
 =======================================================
 
 """
+    
+    @contextmanager
+    def _streamed_report(self, file_path, header: str):
+        """Yield a file that summary text is written to as it arrives.
+        
+        It replaces file_path only if the block completes and something was written
+        after the header, so a failed or empty generation leaves no partial report.
+        """
+        # A unique temp name, so concurrent summaries of the same file never share one
+        partial_path = f"{file_path}.{os.getpid()}.{uuid.uuid4().hex}.part"
+        try:
+            with open(partial_path, 'w', encoding='utf-8') as f:
+                f.write(header)
+                header_end = f.tell()
+                yield f
+                has_content = f.tell() > header_end
+            if has_content:
+                os.replace(partial_path, file_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+    
+    def _save_summary_report(self, file_path: str, summary: str, file_id: str, 
+                           audio_url: Optional[str], transcript_path: str):
+        """Save formatted summary report to file."""
+        header = self._report_header(file_id, audio_url, transcript_path)
         with open(file_path, 'w', encoding='utf-8') as f:
             f.write(header + summary)
 
 
+_agent = None
+
+def _get_agent() -> SummaryAgent:
+    """Get the module's shared SummaryAgent; agents hold no per-call state."""
+    global _agent
+    if _agent is None:
+        _agent = SummaryAgent()
+    return _agent
+
+
 def process_summary(transcript_path: str, audio_url: Optional[str] = None) -> Dict[str, Any]:
     """Main function to process summary generation."""
-    agent = SummaryAgent()
+    agent = _get_agent()
     return agent.generate_summary(transcript_path, audio_url)
 
 
+async def process_summary_async(transcript_path: str, audio_url: Optional[str] = None) -> Dict[str, Any]:
+    """Async variant of process_summary using the AsyncOpenAI client."""
+    agent = _get_agent()
+    return await agent.generate_summary_async(transcript_path, audio_url)
+
+
 if __name__ == "__main__":
     # Test summary agent
     print("Testing Summary Agent...")
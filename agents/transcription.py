@@ -1,15 +1,62 @@
 # Transcription and Diarization Agent
 import os
 import wave
-import numpy as np
-from openai import OpenAI
+import struct
+import asyncio
 from typing import Dict, Any, Optional
 
 from config.settings import (
-    load_env_variable, ENV_VARS, OPENAI_MODELS, 
+    OPENAI_MODELS, OPENAI_RETRY_SETTINGS, UPLOAD_BUFFER_SIZE, CACHE_EXPIRE_SECONDS,
     TEMPERATURE_SETTINGS, get_file_path
 )
-from utils.helpers import get_audio_file_identifier, validate_audio_file
+from utils.helpers import get_audio_file_identifier, validate_audio_file, write_utf8_file
+from utils.cache import get_response_cache, make_cache_key, hash_file_with_head
+from utils.openai_client import (
+    get_openai_client, get_async_openai_client, call_with_retries, acall_with_retries
+)
+
+# Bytes read when probing a WAV header for its duration (one filesystem block)
+_WAV_HEADER_PROBE_BYTES = 4096
+# WAVE_FORMAT_PCM and WAVE_FORMAT_EXTENSIBLE, the fmt tags wave accepts
+_PCM_FORMAT_TAGS = (0x0001, 0xFFFE)
+
+def _duration_from_wav_header(header: bytes) -> Optional[float]:
+    """Duration of a PCM WAV from its leading bytes, or None if they don't hold the fmt and data headers."""
+    if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        return None
+    
+    channels = rate = bits = None
+    offset = 12
+    while offset + 8 <= len(header):
+        chunk_id, chunk_size = struct.unpack_from('<4sI', header, offset)
+        if chunk_id == b'fmt ' and offset + 24 <= len(header):
+            format_tag, channels, rate, _, _, bits = struct.unpack_from('<HHIIHH', header, offset + 8)
+            # Other encodings are left to wave, which rejects them as before
+            if format_tag not in _PCM_FORMAT_TAGS:
+                return None
+        elif chunk_id == b'data':
+            if not (channels and rate and bits):
+                return None
+            # Same frame count wave computes: whole frames in the data chunk
+            return chunk_size // (channels * ((bits + 7) // 8)) / float(rate)
+        # Chunks are padded to an even size
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+async def _upload_audio(file_path: str, request: Dict[str, Any]) -> str:
+    """Transcribe one file with the AsyncOpenAI client of the running (pipeline) loop."""
+    client = get_async_openai_client().with_options(
+        timeout=OPENAI_RETRY_SETTINGS['TRANSCRIPTION_TIMEOUT_SECONDS']
+    )
+    # The file is streamed to the socket in chunks rather than read into memory;
+    # each chunk read comes from the 1 MB buffer, so it barely blocks the loop
+    with open(file_path, "rb", buffering=UPLOAD_BUFFER_SIZE) as audio_file:
+        async def upload():
+            # A retry must resend the file from the start
+            audio_file.seek(0)
+            return await client.audio.transcriptions.create(file=audio_file, **request)
+        
+        return await acall_with_retries(upload)
 
 class TranscriptionAgent:
     """Handles audio transcription and basic speaker identification."""
@@ -19,17 +66,24 @@ class TranscriptionAgent:
         self.initialize_openai()
     
     def initialize_openai(self):
-        """Initialize OpenAI client."""
-        api_key = load_env_variable(ENV_VARS['OPENAI_API_KEY'], required=True)
-        if api_key:
-            self.client = OpenAI(api_key=api_key)
-            print("✅ OpenAI client initialized for transcription")
-        else:
-            print("⚠️  OpenAI API key not found")
+        """Attach the shared OpenAI client, with a longer timeout for audio uploads."""
+        self.client = get_openai_client().with_options(
+            timeout=OPENAI_RETRY_SETTINGS['TRANSCRIPTION_TIMEOUT_SECONDS']
+        )
+        print("✅ OpenAI client initialized for transcription")
     
-    def get_audio_duration(self, file_path: str) -> float:
-        """Get audio file duration in seconds."""
+    def get_audio_duration(self, file_path: str, header: Optional[bytes] = None) -> float:
+        """Get audio file duration in seconds (from the file's leading bytes, if already read)."""
         try:
+            # Headers within the first block are parsed from one read; anything else
+            # (or anything unusual) goes through wave
+            if header is None:
+                with open(file_path, 'rb') as f:
+                    header = f.read(_WAV_HEADER_PROBE_BYTES)
+            duration = _duration_from_wav_header(header)
+            if duration is not None:
+                return duration
+            
             with wave.open(file_path, 'rb') as wf:
                 frames = wf.getnframes()
                 rate = wf.getframerate()
@@ -40,51 +94,71 @@ class TranscriptionAgent:
     
     def transcribe_audio(self, file_path: str, audio_url: Optional[str] = None) -> Dict[str, Any]:
         """Transcribe audio file using OpenAI's gpt-4o-mini-transcribe model."""
-        if not self.client:
-            return {
-                "status": "error",
-                "error_message": "OpenAI client not initialized"
-            }
-        
-        # Validate audio file
-        validation = validate_audio_file(file_path)
-        if not validation['valid']:
-            return {
-                "status": "error",
-                "error_message": validation['error']
-            }
+        error = self._validate_inputs(self.client, file_path)
+        if error:
+            return error
         
         file_id = get_audio_file_identifier(audio_url, file_path)
         
         try:
-            # Get audio duration
-            duration = self.get_audio_duration(file_path)
+            # One pass over the file gives both the content digest and the header for the duration
+            audio_digest, header = hash_file_with_head(file_path, _WAV_HEADER_PROBE_BYTES, UPLOAD_BUFFER_SIZE)
+            duration = self.get_audio_duration(file_path, header)
+            
+            # Identical audio (by content) reuses its cached transcript
+            cache_key = self._cache_key(audio_digest)
+            response = get_response_cache().get(cache_key)
+            if response is not None:
+                transcript_path = self._save_transcript(file_id, response)
+                return self._build_result(response, file_id, duration, transcript_path, cache_hit=True)
             
-            # Transcribe with speaker hints for better formatting
-            with open(file_path, "rb") as audio_file:
-                response = self.client.audio.transcriptions.create(
-                    model=OPENAI_MODELS['TRANSCRIPTION'],
-                    file=audio_file,
-                    response_format="text",
-                    temperature=TEMPERATURE_SETTINGS['TRANSCRIPTION'],
-                    language="ar",
-                    prompt="Transcribe the conversation between a callcenter agent and a patient. Format the output as follows:\n\nCallcenter: [what the callcenter agent says]\nPatient: [what the patient says]\n\nMake sure to identify who is speaking for each turn in the conversation."
-                )
+            # Transcribe with speaker hints for better formatting; the file is streamed
+            # to the socket in chunks rather than read into memory
+            with open(file_path, "rb", buffering=UPLOAD_BUFFER_SIZE) as audio_file:
+                def upload():
+                    # A retry must resend the file from the start
+                    audio_file.seek(0)
+                    return self.client.audio.transcriptions.create(file=audio_file, **self._build_request())
+                
+                response = call_with_retries(upload)
             
-            # Save transcript to file
-            transcript_path = get_file_path('TRANSCRIPT', file_id)
-            with open(transcript_path, 'w', encoding='utf-8') as f:
-                f.write(response)
+            get_response_cache().set(cache_key, response, expire=CACHE_EXPIRE_SECONDS)
+            transcript_path = self._save_transcript(file_id, response)
+            return self._build_result(response, file_id, duration, transcript_path)
             
+        except Exception as e:
             return {
-                "status": "success",
+                "status": "error",
                 "file_identifier": file_id,
-                "audio_duration": duration,
-                "transcript": response,
-                "transcript_path": str(transcript_path),
-                "speaker_turns_count": len([line for line in response.split('\n') if line.strip()]),
-                "model_used": OPENAI_MODELS['TRANSCRIPTION']
+                "error_message": f"Transcription failed: {str(e)}"
             }
+    
+    async def transcribe_audio_async(self, file_path: str, audio_url: Optional[str] = None) -> Dict[str, Any]:
+        """Transcribe audio file without blocking the event loop."""
+        error = self._validate_inputs(self.client, file_path)
+        if error:
+            return error
+        
+        file_id = get_audio_file_identifier(audio_url, file_path)
+        
+        try:
+            # One pass over the file gives both the content digest and the header for the duration
+            audio_digest, header = await asyncio.to_thread(
+                hash_file_with_head, file_path, _WAV_HEADER_PROBE_BYTES, UPLOAD_BUFFER_SIZE
+            )
+            duration = self.get_audio_duration(file_path, header)
+            
+            # Identical audio (by content) reuses its cached transcript
+            cache_key = self._cache_key(audio_digest)
+            response = get_response_cache().get(cache_key)
+            cache_hit = response is not None
+            if not cache_hit:
+                response = await _upload_audio(file_path, self._build_request())
+                get_response_cache().set(cache_key, response, expire=CACHE_EXPIRE_SECONDS)
+            
+            # The next stages read the transcript file, so the write is awaited, just off the loop
+            transcript_path = await asyncio.to_thread(self._save_transcript, file_id, response)
+            return self._build_result(response, file_id, duration, transcript_path, cache_hit)
             
         except Exception as e:
             return {
@@ -92,14 +166,85 @@ class TranscriptionAgent:
                 "file_identifier": file_id,
                 "error_message": f"Transcription failed: {str(e)}"
             }
+    
+    def _validate_inputs(self, client, file_path: str) -> Optional[Dict[str, Any]]:
+        """Return an error result if the file cannot be transcribed, otherwise None."""
+        if not client:
+            return {
+                "status": "error",
+                "error_message": "OpenAI client not initialized"
+            }
+        
+        # Validate audio file
+        validation = validate_audio_file(file_path)
+        if not validation['valid']:
+            return {
+                "status": "error",
+                "error_message": validation['error']
+            }
+        
+        return None
+    
+    def _build_request(self) -> Dict[str, Any]:
+        """Build the transcription request parameters (everything but the file)."""
+        return {
+            "model": OPENAI_MODELS['TRANSCRIPTION'],
+            "response_format": "text",
+            "temperature": TEMPERATURE_SETTINGS['TRANSCRIPTION'],
+            "language": "ar",
+            "prompt": "Transcribe the conversation between a callcenter agent and a patient. Format the output as follows:\n\nCallcenter: [what the callcenter agent says]\nPatient: [what the patient says]\n\nMake sure to identify who is speaking for each turn in the conversation."
+        }
+    
+    def _cache_key(self, audio_digest: str) -> str:
+        """Response cache key for transcribing audio with this content digest."""
+        return make_cache_key({**self._build_request(), "audio_digest": audio_digest})
+    
+    def _save_transcript(self, file_id: str, response: str):
+        """Save the transcript to file and return its path."""
+        transcript_path = get_file_path('TRANSCRIPT', file_id)
+        write_utf8_file(transcript_path, response)
+        return transcript_path
+    
+    def _build_result(self, response: str, file_id: str, duration: float, transcript_path,
+                      cache_hit: bool = False) -> Dict[str, Any]:
+        """Build the transcription result."""
+        # Non-blank lines, counted without building stripped copies of each one
+        lines = response.split('\n')
+        speaker_turns = len(lines) - lines.count('') - sum(map(str.isspace, lines))
+        
+        return {
+            "status": "success",
+            "file_identifier": file_id,
+            "audio_duration": duration,
+            "transcript": response,
+            "transcript_path": str(transcript_path),
+            "speaker_turns_count": speaker_turns,
+            "model_used": OPENAI_MODELS['TRANSCRIPTION'],
+            "cache_hit": cache_hit
+        }
+
+_agent = None
+
+def _get_agent() -> TranscriptionAgent:
+    """Get the module's shared TranscriptionAgent; agents hold no per-call state."""
+    global _agent
+    if _agent is None:
+        _agent = TranscriptionAgent()
+    return _agent
 
 
 def process_transcription(audio_path: str, audio_url: Optional[str] = None) -> Dict[str, Any]:
     """Main function to process audio transcription."""
-    agent = TranscriptionAgent()
+    agent = _get_agent()
     return agent.transcribe_audio(audio_path, audio_url)
 
 
+async def process_transcription_async(audio_path: str, audio_url: Optional[str] = None) -> Dict[str, Any]:
+    """Async variant of process_transcription using the AsyncOpenAI client."""
+    agent = _get_agent()
+    return await agent.transcribe_audio_async(audio_path, audio_url)
+
+
 if __name__ == "__main__":
     # Test transcription agent
     print("Testing Transcription Agent...")
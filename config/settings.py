@@ -13,16 +13,38 @@ load_dotenv(BASE_DIR / '.env')
 OUTPUTS_DIR = BASE_DIR / "outputs"
 OUTPUTS_DIR.mkdir(exist_ok=True)
 
+# On-disk cache for OpenAI responses (keyed by request hash)
+CACHE_DIR = OUTPUTS_DIR / ".cache"
+CACHE_EXPIRE_SECONDS = 14 * 24 * 3600
+
+# Semantic cache for near-duplicate transcripts (opt-in with SEMANTIC_CACHE=1)
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE', '0') == '1'
+SEMANTIC_CACHE_PATH = OUTPUTS_DIR / ".sem_cache" / "cache.sqlite3"
+SEMANTIC_CACHE_THRESHOLD = 0.97
+# Entries older than this are ignored and pruned; each namespace keeps at most MAX_ENTRIES rows
+SEMANTIC_CACHE_EXPIRE_SECONDS = CACHE_EXPIRE_SECONDS
+SEMANTIC_CACHE_MAX_ENTRIES = 2000
+# Input limit of the embedding model (text-embedding-3-small accepts 8191 tokens)
+EMBEDDING_MAX_TOKENS = 8000
+
 # Audio processing constants
 AUDIO_EXTENSIONS = ['.mp3', '.wav', '.m4a', '.ogg', '.flac', '.aac']
 DEFAULT_AUDIO_EXTENSION = '.wav'
 
+# Samples per block in the noise analysis pass (~1M keeps each float32 block cache-friendly)
+NOISE_BLOCK_SAMPLES = 1 << 20
+
+# Recordings whose peak stays below this fraction of full scale (-60 dBFS, about 32 LSBs at
+# 16 bits) are treated as silent; quiet, low-gain recordings sit well above it
+SILENCE_PEAK_RATIO = 0.001
+
 # OpenAI Configuration
 OPENAI_MODELS = {
     'TRANSCRIPTION': 'gpt-4o-transcribe',
     'SUMMARY': 'gpt-4o-mini',
     'EVALUATION': 'gpt-4o-mini',
-    'RECOMMENDATION': 'gpt-4o-mini'
+    'RECOMMENDATION': 'gpt-4o-mini',
+    'EMBEDDING': 'text-embedding-3-small'
 }
 
 # Processing constants
@@ -32,6 +54,53 @@ MAX_TOKEN_LIMITS = {
     'RECOMMENDATION': 1200
 }
 
+# Longest transcript (in tokens) sent to the chat models; longer ones are rejected up front
+PROMPT_TOKEN_BUDGET = 100_000
+
+# Longest single transcript line (in characters) kept when compacting multi-speaker transcripts for evaluation
+TRANSCRIPT_TURN_CHAR_LIMIT = 300
+
+# OpenAI Batch API configuration (used for bulk processing)
+BATCH_API_SETTINGS = {
+    'ENDPOINT': '/v1/chat/completions',
+    'COMPLETION_WINDOW': '24h',
+    'POLL_INTERVAL_SECONDS': 30
+}
+
+# Retry policy for transient OpenAI failures (rate limits, connection errors)
+OPENAI_RETRY_SETTINGS = {
+    'MAX_RETRIES': 3,
+    'INITIAL_DELAY_SECONDS': 1,
+    'REQUEST_TIMEOUT_SECONDS': 60.0,
+    'TRANSCRIPTION_TIMEOUT_SECONDS': 600.0
+}
+
+# HTTP transport for the shared OpenAI clients (sized for concurrent in-flight requests)
+OPENAI_HTTP_SETTINGS = {
+    'HTTP2': True,
+    'MAX_CONNECTIONS': 64,
+    'MAX_KEEPALIVE_CONNECTIONS': 32,
+    'CONNECT_TIMEOUT_SECONDS': 10.0
+}
+
+# Maximum number of audio files processed concurrently in a batch
+MAX_CONCURRENT_FILES = int(os.getenv('MASTER_CONCURRENCY', '8'))
+
+# Maximum number of parallel audio downloads in a batch
+MAX_CONCURRENT_DOWNLOADS = 8
+
+# Files downloaded or in processing at once in a batch; downloads run at most
+# MAX_CONCURRENT_DOWNLOADS files ahead of processing, which bounds temp disk use
+MAX_PREFETCHED_FILES = MAX_CONCURRENT_FILES + MAX_CONCURRENT_DOWNLOADS
+
+# Direct Google Drive download (streamed in chunks; gdown is the fallback)
+GOOGLE_DRIVE_DOWNLOAD_URL = 'https://drive.usercontent.google.com/download'
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+DOWNLOAD_TIMEOUT_SECONDS = 60.0
+
+# Read buffer for audio streamed to the transcription API
+UPLOAD_BUFFER_SIZE = 1 << 20
+
 TEMPERATURE_SETTINGS = {
     'TRANSCRIPTION': 0.2,
     'SUMMARY': 0.3,
@@ -112,9 +181,28 @@ Guidelines:
 - Provide recommendations in Arabic
 - Focus on constructive feedback that leads to measurable improvements
 
-Format your recommendations clearly with priority levels (High/Medium/Low)."""
+Respond with a JSON object with a single key, "recommendations": a list in which each recommendation appears once, as an object with these fields:
+- "text": the recommendation (in Arabic)
+- "priority": one of "high", "medium", "low"
+- "category": one of "communication", "process", "training", "system"
+Use an empty list if there are no recommendations."""
 }
 
+# Firebase Auth REST API (sign-up, sign-in, token refresh) over a shared, pooled session
+FIREBASE_AUTH_SETTINGS = {
+    'IDENTITY_TOOLKIT_URL': 'https://identitytoolkit.googleapis.com/v1',
+    'SECURE_TOKEN_URL': 'https://securetoken.googleapis.com/v1/token',
+    'POOL_CONNECTIONS': 4,
+    'POOL_MAXSIZE': 10,
+    'TIMEOUT_SECONDS': 10.0
+}
+
+# processing_history fields returned for history list views (leaves out results/metadata)
+HISTORY_SUMMARY_FIELDS = ['audio_file_id', 'audio_url', 'processing_type', 'status', 'processing_time', 'timestamp']
+
+# Background threads writing processing results to Firestore after the response is sent
+HISTORY_SAVE_WORKERS = 4
+
 # Rate limiting configuration
 RATE_LIMITS = {
     'FREE_TIER': {
@@ -137,6 +225,9 @@ FILE_PATTERNS = {
     'NOISE_JSON': '{file_id}_noise_report.json'
 }
 
+# FILE_PATTERNS split around '{file_id}' once, so building a path is a plain concatenation
+_FILE_PATTERN_PARTS = {key: tuple(pattern.split('{file_id}', 1)) for key, pattern in FILE_PATTERNS.items()}
+
 def load_env_variable(var_name: str, required: bool = False, default: str = None) -> str:
     """Load environment variable with fallback to default."""
     value = os.getenv(var_name, default or ENV_DEFAULTS.get(var_name))
@@ -148,5 +239,5 @@ def load_env_variable(var_name: str, required: bool = False, default: str = None
 
 def get_file_path(pattern_key: str, file_id: str) -> Path:
     """Get full file path for a given pattern and file ID."""
-    filename = FILE_PATTERNS[pattern_key].format(file_id=file_id)
-    return OUTPUTS_DIR / filename
+    prefix, suffix = _FILE_PATTERN_PARTS[pattern_key]
+    return OUTPUTS_DIR / f"{prefix}{file_id}{suffix}"
@@ -1,7 +1,15 @@
 # Clean Call Center Agent Server with Firebase Authentication
 import os
 import sys
+import atexit
+import importlib
+import time
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 from flask import Flask, request, jsonify, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from datetime import datetime, timedelta
@@ -9,18 +17,54 @@ from datetime import datetime, timedelta
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config.settings import load_env_variable, ENV_VARS
-from utils.firebase import firebase_auth, firebase_db
+from config.settings import (
+    load_env_variable, ENV_VARS, RATE_LIMITS, HISTORY_SAVE_WORKERS, HISTORY_SUMMARY_FIELDS
+)
 from utils.helpers import is_valid_google_drive_link, get_audio_file_identifier
-from agents.master import process_single_audio
+from agents.master import process_single_audio_async
+
+class _LazyFirebase:
+    """Stand-in for a utils.firebase singleton that imports and initializes Firebase on first use.
+    
+    Importing and initializing Firebase (Admin SDK, Firestore client) takes ~0.5 s,
+    which static pages and startup don't need.
+    """
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._target = None
+    
+    def __getattr__(self, attr):
+        if self._target is None:
+            # The import lock makes concurrent first uses initialize only once
+            self._target = getattr(importlib.import_module('utils.firebase'), self._name)
+        return getattr(self._target, attr)
+
+firebase_auth = _LazyFirebase('firebase_auth')
+firebase_db = _LazyFirebase('firebase_db')
 
 # Set static folder path
 STATIC_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
 print(f"Static folder path: {STATIC_FOLDER}")
 print(f"Static folder exists: {os.path.exists(STATIC_FOLDER)}")
 
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (jsonify, request.get_json)."""
+    
+    def dumps(self, obj, **kwargs) -> str:
+        # Keys stay sorted as with Flask's default provider; datetimes, decimals etc.
+        # still go through its default() so they serialize the same way
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 # Initialize Flask app with static folder configuration
 app = Flask(__name__, static_folder=STATIC_FOLDER, static_url_path='/static')
+app.json = OrjsonProvider(app)
 CORS(app)
 
 # JWT Configuration
@@ -167,14 +211,17 @@ def get_profile():
 
 @app.route('/api/user/history', methods=['GET'])
 def get_history():
-    """Get user processing history."""
+    """Get user processing history (?summary=true leaves out the full results)."""
     user = get_current_user_from_token()
     if not user:
         return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
     
     try:
         limit = request.args.get('limit', 10, type=int)
-        result = firebase_db.get_user_history(user['uid'], limit)
+        summary = request.args.get('summary', 'false').lower() == 'true'
+        result = firebase_db.get_user_history(
+            user['uid'], limit, fields=HISTORY_SUMMARY_FIELDS if summary else None
+        )
         status_code = 200 if result['status'] == 'success' else 400
         return jsonify(result), status_code
     except Exception as e:
@@ -188,8 +235,12 @@ def get_history():
 # ============================================================================
 
 @app.route('/api/analyze', methods=['POST'])
-def analyze_audio():
-    """Audio analysis endpoint with optional authentication."""
+async def analyze_audio():
+    """Audio analysis endpoint with optional authentication.
+    
+    Async view (needs flask[async]): the pipeline runs on the shared pipeline loop,
+    where its OpenAI calls are awaited concurrently over one pooled client.
+    """
     print("🎯 Audio analysis request received")
     
     # Get current user (optional)
@@ -227,7 +278,8 @@ def analyze_audio():
             }), 400
         
         # Check rate limits for authenticated users
-        if user and firebase_db.db:
+        rate_limited = bool(user and firebase_db.db)
+        if rate_limited:
             if not check_user_rate_limit(user['uid']):
                 return jsonify({
                     'status': 'error', 
@@ -236,19 +288,28 @@ def analyze_audio():
         
         print(f"🎯 Processing audio: {drive_link}")
         
-        # Process audio file through master agent
-        start_time = datetime.now()
-        result = process_single_audio(drive_link, custom_prompt)
-        processing_time = (datetime.now() - start_time).total_seconds()
+        # Process audio file through master agent; only requests that reach the user's
+        # history keep their rate limit slot
+        start_time = time.monotonic()
+        try:
+            result = await process_single_audio_async(drive_link, custom_prompt)
+        except BaseException:
+            if rate_limited:
+                release_user_rate_limit(user['uid'])
+            raise
+        processing_time = time.monotonic() - start_time
+        if rate_limited and result.get('status') not in ['completed', 'completed_with_errors']:
+            release_user_rate_limit(user['uid'])
         
         # Add processing metadata
         result['processing_time'] = processing_time
         result['authenticated'] = user is not None
         result['timestamp'] = datetime.now().isoformat()
         
-        # Save results for authenticated users
+        # Save results for authenticated users; the client already has them, so the
+        # Firestore write happens after the response instead of delaying it
         if user and result.get('status') in ['completed', 'completed_with_errors']:
-            save_user_processing_result(user['uid'], result, drive_link)
+            _history_saver.submit(save_user_processing_result, user['uid'], result, drive_link)
         
         print(f"✅ Processing completed in {processing_time:.2f}s with status: {result.get('status')}")
         
@@ -345,36 +406,90 @@ def get_current_user_from_token():
     
     return None
 
+# Sliding one-hour window of request times (time.monotonic) per user, kept in process, so
+# the server must run as a single worker (see README). Firestore history is only read to seed
+# a user's window when it is first seen; windows idle for a full hour are evicted (oldest
+# access first)
+RATE_WINDOW_SECONDS = 3600
+_rate_windows = OrderedDict()
+_rate_lock = threading.Lock()
+
+def _load_recent_request_times(uid: str) -> list:
+    """Monotonic times of the user's saved requests within the last hour, oldest first."""
+    result = firebase_db.get_user_history(
+        uid, limit=RATE_LIMITS['FREE_TIER']['REQUESTS_PER_HOUR'], fields=['timestamp']
+    )
+    
+    if result['status'] != 'success':
+        return []  # Start empty if we can't check
+    
+    now = time.monotonic()
+    times = []
+    for record in result.get('history', []):
+        try:
+            record_time = datetime.fromisoformat(record['timestamp'].replace('Z', '+00:00'))
+            age = (datetime.now(record_time.tzinfo) - record_time).total_seconds()
+            if age < RATE_WINDOW_SECONDS:
+                times.append(now - age)
+        except:
+            continue
+    
+    return sorted(times)
+
 def check_user_rate_limit(uid: str) -> bool:
-    """Check if user has exceeded rate limits."""
+    """Check if user has exceeded rate limits, reserving a slot for this request if not.
+    
+    Requests that don't end up in the user's history hand the slot back with
+    release_user_rate_limit, so the window matches the history it is seeded from.
+    """
     try:
-        # Simple rate limiting - get recent history
-        result = firebase_db.get_user_history(uid, limit=20)
-        
-        if result['status'] != 'success':
-            return True  # Allow if we can't check
-        
-        history = result.get('history', [])
-        
-        # Count requests in the last hour
-        one_hour_ago = datetime.now() - timedelta(hours=1)
-        recent_requests = 0
-        
-        for record in history:
-            try:
-                record_time = datetime.fromisoformat(record['timestamp'].replace('Z', '+00:00'))
-                if record_time > one_hour_ago:
-                    recent_requests += 1
-            except:
-                continue
-        
-        # Allow up to 10 requests per hour for free users
-        return recent_requests < 10
+        limit = RATE_LIMITS['FREE_TIER']['REQUESTS_PER_HOUR']
+        
+        with _rate_lock:
+            window = _rate_windows.get(uid)
+        if window is None:
+            # Seed outside the lock so one user's Firestore read doesn't stall others
+            seed = _load_recent_request_times(uid)
+            with _rate_lock:
+                window = _rate_windows.setdefault(uid, deque(seed, maxlen=limit))
+        
+        now = time.monotonic()
+        with _rate_lock:
+            _evict_idle_rate_windows(now)
+            # Re-added in case it was evicted since it was looked up
+            _rate_windows[uid] = window
+            _rate_windows.move_to_end(uid)
+            while window and window[0] <= now - RATE_WINDOW_SECONDS:
+                window.popleft()
+            if len(window) >= limit:
+                return False
+            window.append(now)
+            return True
         
     except Exception as e:
         print(f"Rate limit check error: {e}")
         return True  # Allow if check fails
 
+def release_user_rate_limit(uid: str):
+    """Hand back a slot reserved by check_user_rate_limit for a request that was not saved."""
+    with _rate_lock:
+        window = _rate_windows.get(uid)
+        if window:
+            window.pop()
+
+def _evict_idle_rate_windows(now: float):
+    """Drop windows of users with no request in the last hour; call with _rate_lock held."""
+    # Windows are ordered by last check, so the scan stops at the first one still in use
+    while _rate_windows:
+        uid, window = next(iter(_rate_windows.items()))
+        if window and window[-1] > now - RATE_WINDOW_SECONDS:
+            break
+        del _rate_windows[uid]
+
+# Runs save_user_processing_result off the request path; pending saves finish on shutdown
+_history_saver = ThreadPoolExecutor(max_workers=HISTORY_SAVE_WORKERS, thread_name_prefix='history-save')
+atexit.register(_history_saver.shutdown)
+
 def save_user_processing_result(uid: str, result: dict, drive_link: str):
     """Save processing result to user's history."""
     try:
@@ -443,4 +558,6 @@ if __name__ == '__main__':
     port = int(load_env_variable('PORT', default='5000'))
     debug = load_env_variable('DEBUG', default='True').lower() == 'true'
     
-    app.run(host=host, port=port, debug=debug)
+    # Development server only; in production run under gunicorn with threaded workers:
+    #   gunicorn server.app:app -k gthread -w $(nproc) --threads 8 --timeout 300
+    app.run(host=host, port=port, debug=debug, threaded=True)
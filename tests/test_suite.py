@@ -40,7 +40,7 @@ def test_helpers():
         from utils.helpers import (
             extract_google_drive_file_id, get_audio_file_identifier,
             is_valid_google_drive_link, validate_audio_file, 
-            format_duration, clean_text_for_processing
+            format_duration, clean_text_for_processing, compress_transcript_for_eval
         )
         
         # Test Google Drive ID extraction
@@ -61,6 +61,34 @@ def test_helpers():
         clean_text = clean_text_for_processing(dirty_text)
         assert clean_text == "Hello World", f"Text cleaning failed: '{clean_text}'"
         
+        # Test transcript compaction (timestamps, same-speaker merge, repeated turns)
+        raw_transcript = "[00:01] Agent: Hello\nAgent: How can I help?\nCustomer: Hi\nCustomer: Hi"
+        compact = compress_transcript_for_eval(raw_transcript)
+        assert compact == "Agent: Hello How can I help?\nCustomer: Hi", f"Transcript compaction failed: '{compact}'"
+        
+        # Single-paragraph and unlabelled transcripts have no turns to cap and keep all their text
+        paragraph = "Callcenter: " + "كيف يمكنني مساعدتك اليوم؟ " * 40
+        compact = compress_transcript_for_eval(paragraph)
+        assert compact == paragraph.strip(), f"Single-paragraph transcript was truncated: {len(compact)} chars"
+        unlabelled = "\n".join(f"شكرا لاتصالك بنا وسنقوم بالرد على الطلب رقم {i} في أقرب وقت ممكن" for i in range(40))
+        compact = compress_transcript_for_eval(unlabelled, max_turn_chars=50)
+        assert compact == unlabelled.replace("\n", " "), f"Unlabelled transcript was truncated: {len(compact)} chars"
+        
+        # Multi-speaker lines are capped one at a time, before same-speaker merging
+        long_line = "x" * 400
+        compact = compress_transcript_for_eval(f"Agent: {long_line}\nAgent: second line\nCustomer: ok", max_turn_chars=300)
+        assert compact == f"Agent: {'x' * 300}… second line\nCustomer: ok", f"Per-line cap failed: '{compact}'"
+        
+        # The same short answer to different questions is kept
+        answers = "Callcenter: هل لديك موعد؟\nPatient: نعم\nCallcenter: هل هو اليوم؟\nPatient: نعم"
+        compact = compress_transcript_for_eval(answers)
+        assert compact == answers, f"Repeated answer was dropped: '{compact}'"
+        
+        # A time inside an unlabelled line is not a speaker label
+        timed = "الموعد الساعة 10:30 صباحا تمام"
+        compact = compress_transcript_for_eval(timed)
+        assert compact == timed, f"Unlabelled line with a time was rewritten: '{compact}'"
+        
         print("✅ Helper function tests passed")
         return True
         
@@ -75,13 +103,18 @@ def test_firebase_connection():
         from utils.firebase import firebase_auth, firebase_db
         
         # Test Firebase initialization (non-destructive)
-        if firebase_auth.pyrebase_app:
+        if firebase_auth.session:
             print("✅ Firebase Auth initialized")
         else:
             print("⚠️  Firebase Auth not initialized (check config)")
         
         if firebase_db.db:
             print("✅ Firebase Database initialized")
+            health = firebase_db.health_check()
+            if health['status'] == 'success':
+                print("✅ Firebase Database connection verified")
+            else:
+                print(f"⚠️  {health['message']}")
         else:
             print("⚠️  Firebase Database not initialized (check config)")
         
@@ -123,6 +156,204 @@ def test_transcription_agent():
         print(f"❌ Transcription agent test failed: {e}")
         return False
 
+def test_wav_header_duration():
+    """Test that the WAV header parser matches the wave module."""
+    print("\n=== Testing WAV Header Duration ===")
+    try:
+        import io
+        import struct
+        import wave
+        from agents.transcription import _duration_from_wav_header
+
+        def make_wav(channels, sample_width, rate, frames):
+            buffer = io.BytesIO()
+            with wave.open(buffer, 'wb') as wav_file:
+                wav_file.setnchannels(channels)
+                wav_file.setsampwidth(sample_width)
+                wav_file.setframerate(rate)
+                wav_file.writeframes(b'\x00' * (frames * channels * sample_width))
+            return buffer.getvalue()
+
+        def wave_duration(data):
+            with wave.open(io.BytesIO(data), 'rb') as wav_file:
+                return wav_file.getnframes() / float(wav_file.getframerate())
+
+        samples = [make_wav(1, 2, 16000, 16000), make_wav(2, 1, 8000, 12345), make_wav(2, 3, 44100, 999)]
+
+        # An odd-sized LIST chunk (plus its pad byte) between fmt and data
+        data = samples[0]
+        extra_chunk = b'LIST' + struct.pack('<I', 5) + b'INFOx' + b'\x00'
+        data = data[:36] + extra_chunk + data[36:]
+        samples.append(data[:4] + struct.pack('<I', len(data) - 8) + data[8:])
+
+        # A trailing partial frame in the data chunk only counts whole frames
+        data = make_wav(2, 2, 8000, 100)
+        data_size = struct.unpack_from('<I', data, 40)[0] + 3
+        data = data[:40] + struct.pack('<I', data_size) + data[44:] + b'\x00' * 3
+        samples.append(data[:4] + struct.pack('<I', len(data) - 8) + data[8:])
+
+        for sample in samples:
+            duration = _duration_from_wav_header(sample[:4096])
+            expected = wave_duration(sample)
+            assert duration == expected, f"Header duration {duration} != wave duration {expected}"
+
+        # Non-WAV data is left to the fallback path
+        assert _duration_from_wav_header(b'ID3\x04' + b'\x00' * 60) is None, "Non-WAV header should give None"
+
+        print("✅ WAV header duration tests passed")
+        return True
+
+    except Exception as e:
+        print(f"❌ WAV header duration test failed: {e}")
+        return False
+
+def test_noise_metrics_match_reference():
+    """Test that the fused noise metrics match straightforward float64 formulas."""
+    print("\n=== Testing Noise Metrics ===")
+    try:
+        import numpy as np
+        from config.settings import NOISE_BLOCK_SAMPLES
+        from agents.noise_analysis import NoiseAnalysisAgent, _fused_stats
+        
+        agent = NoiseAnalysisAgent()
+        sample_rate = 16000
+        segment_size = sample_rate // 4
+        rng = np.random.default_rng(1)
+        
+        for dtype, sample_width in ((np.int16, 2), (np.int32, 4)):
+            info = np.iinfo(dtype)
+            full_scale = float(info.max) + 1
+            # Longer than one block and not a multiple of the block or segment size
+            length = NOISE_BLOCK_SAMPLES + 3 * segment_size + 123
+            envelope = np.repeat(rng.uniform(0.01, 0.5, size=length // segment_size + 1), segment_size)[:length]
+            signal = rng.standard_normal(length) * envelope * full_scale
+            audio_data = np.clip(signal, info.min, info.max).astype(dtype)
+            # Full-scale samples of both signs, including the most negative value
+            audio_data[[5, 1000, length - 1]] = info.min
+            audio_data[[7, 2000]] = info.max
+            # A sign change exactly across the first block boundary
+            block_size = max(1, NOISE_BLOCK_SAMPLES // segment_size) * segment_size
+            audio_data[block_size - 1], audio_data[block_size] = -5, 5
+            
+            audio_stats = {'sample_rate': sample_rate, 'sample_width': sample_width,
+                           'channels': 1, 'duration': length / sample_rate}
+            metrics = agent._calculate_quality_metrics(audio_stats, audio_data)
+            
+            # Reference: the original float64 formulas, in fractions of full scale
+            reference = audio_data.astype(np.float64)
+            num_segments = length // segment_size
+            segments = reference[:num_segments * segment_size].reshape(num_segments, segment_size) / full_scale
+            segment_powers = np.mean(segments ** 2, axis=1)
+            noise_floor, signal_power = np.percentile(segment_powers, [25, 75])
+            max_value = info.max
+            expected = {
+                "rms": np.sqrt(np.mean((reference / full_scale) ** 2)),
+                "peak_amplitude": np.max(np.abs(reference)) / full_scale,
+                "snr_db": 10 * np.log10(signal_power / noise_floor),
+                "clipping_percentage": np.sum(np.abs(reference) >= max_value * 0.99) / length * 100,
+                "zero_crossing_rate": np.sum(np.diff(np.signbit(reference))) / length
+            }
+            for name, value in expected.items():
+                # Counts (clipping, zero crossings) must match exactly; float32 powers to 1e-4
+                exact = name in ("peak_amplitude", "clipping_percentage", "zero_crossing_rate")
+                matches = metrics[name] == value if exact else np.isclose(metrics[name], value, rtol=1e-4)
+                assert matches, f"{dtype.__name__} {name}: got {metrics[name]}, expected {value}"
+            
+            _, _, _, _, fused_powers = _fused_stats(audio_data, segment_size, max_value * 0.99,
+                                                    np.float32(1.0 / full_scale))
+            assert np.allclose(fused_powers, segment_powers, rtol=1e-4), f"{dtype.__name__} segment powers differ"
+        
+        print("✅ Noise metrics tests passed")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Noise metrics test failed: {e}")
+        return False
+
+def test_quiet_audio_not_silent():
+    """Test that a quiet, low-gain recording is analyzed rather than reported as silent."""
+    print("\n=== Testing Quiet Audio Detection ===")
+    try:
+        import numpy as np
+        from agents.noise_analysis import NoiseAnalysisAgent
+        
+        agent = NoiseAnalysisAgent()
+        sample_rate = 16000
+        audio_stats = {'sample_rate': sample_rate, 'sample_width': 2, 'channels': 1, 'duration': 10.0}
+        
+        # Speech-like bursts peaking around -44 dBFS over a quieter noise floor
+        rng = np.random.default_rng(0)
+        envelope = np.repeat(rng.choice([0.05, 1.0], size=40), sample_rate // 4)
+        quiet = (rng.standard_normal(len(envelope)) * envelope * 60).clip(-200, 200).astype(np.int16)
+        metrics = agent._calculate_quality_metrics(audio_stats, quiet)
+        assert not metrics.get('silent'), "Quiet recording was reported as silent"
+        assert metrics['snr_db'] > 20, f"Quiet recording SNR too low: {metrics['snr_db']}"
+        
+        # A few LSBs of dither is still silence
+        dither = rng.integers(-4, 5, size=len(envelope)).astype(np.int16)
+        metrics = agent._calculate_quality_metrics(audio_stats, dither)
+        assert metrics.get('silent'), "Near-zero recording should be reported as silent"
+        
+        print("✅ Quiet audio detection tests passed")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Quiet audio detection test failed: {e}")
+        return False
+
+def test_transcription_upload():
+    """Test that concurrent uploads give each caller its own transcript or error."""
+    print("\n=== Testing Transcription Upload ===")
+    import agents.transcription as transcription
+    original_client_getter = transcription.get_async_openai_client
+    temp_paths = []
+    try:
+        import asyncio
+        from types import SimpleNamespace
+
+        uploads = []
+
+        async def create(file, **request):
+            content = file.read()
+            uploads.append(content)
+            if content == b"bad":
+                raise ValueError("upload rejected")
+            return content.decode() + request["suffix"]
+
+        fake_client = SimpleNamespace(audio=SimpleNamespace(transcriptions=SimpleNamespace(create=create)))
+        fake_client.with_options = lambda **options: fake_client
+        transcription.get_async_openai_client = lambda: fake_client
+
+        for content in (b"one", b"bad", b"two"):
+            temp_file = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
+            temp_file.write(content)
+            temp_file.close()
+            temp_paths.append(temp_file.name)
+
+        async def transcribe_all():
+            return await asyncio.gather(
+                *(transcription._upload_audio(path, {"suffix": "!"}) for path in temp_paths),
+                return_exceptions=True
+            )
+
+        results = asyncio.run(transcribe_all())
+
+        assert results[0] == "one!" and results[2] == "two!", f"Unexpected transcripts: {results}"
+        assert isinstance(results[1], ValueError), f"Upload error should reach its caller: {results[1]!r}"
+        assert sorted(uploads) == [b"bad", b"one", b"two"], f"Each file should be uploaded once: {uploads}"
+
+        print("✅ Transcription upload tests passed")
+        return True
+
+    except Exception as e:
+        print(f"❌ Transcription upload test failed: {e}")
+        return False
+
+    finally:
+        transcription.get_async_openai_client = original_client_getter
+        for path in temp_paths:
+            os.unlink(path)
+
 def test_summary_agent():
     """Test summary agent functionality."""
     print("\n=== Testing Summary Agent ===")
@@ -137,9 +368,8 @@ def test_summary_agent():
         test_transcript_path = transcripts_dir / "test_transcript.txt"
 
         if test_transcript_path.exists():
-            # Test transcript reading
-            with open(test_transcript_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            # Test transcript reading (one bulk read, decoded once)
+            content = test_transcript_path.read_bytes().decode('utf-8')
 
             assert len(content) > 0, "Test transcript should have content"
             print("✅ Transcript reading test passed")
@@ -296,6 +526,10 @@ def run_all_tests():
         test_google_drive_functions,
         test_firebase_connection,
         test_transcription_agent,
+        test_wav_header_duration,
+        test_noise_metrics_match_reference,
+        test_quiet_audio_not_silent,
+        test_transcription_upload,
         test_summary_agent,
         test_openai_connection,
     ]
@@ -334,6 +568,10 @@ if __name__ == "__main__":
     # test_google_drive_functions()
     # test_firebase_connection()
     # test_transcription_agent()
+    # test_wav_header_duration()
+    # test_noise_metrics_match_reference()
+    # test_quiet_audio_not_silent()
+    # test_transcription_upload()
     # test_summary_agent()
     # test_openai_connection()
     
@@ -0,0 +1,121 @@
+# Response cache utilities for Call Center Agent
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import diskcache
+import numpy as np
+
+from config.settings import (
+    CACHE_DIR, SEMANTIC_CACHE_PATH, SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_EXPIRE_SECONDS, SEMANTIC_CACHE_MAX_ENTRIES
+)
+
+_response_cache = None
+_semantic_cache = None
+
+def get_response_cache() -> diskcache.Cache:
+    """Get the shared on-disk response cache, opening it on first use."""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = diskcache.Cache(str(CACHE_DIR))
+    return _response_cache
+
+def make_cache_key(request: Dict[str, Any]) -> str:
+    """Build a deterministic cache key from OpenAI request parameters."""
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def hash_file_with_head(path, head_size: int, chunk_size: int = 1 << 20) -> Tuple[str, bytes]:
+    """Content digest of a file plus its first head_size bytes, from one chunked pass
+    (so large audio never sits in memory)."""
+    digest = hashlib.blake2b(digest_size=16)
+    head = b''
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            if len(head) < head_size:
+                head += chunk[:head_size - len(head)]
+            digest.update(chunk)
+    return digest.hexdigest(), head
+
+class SemanticCache:
+    """Nearest-neighbour cache of responses keyed by transcript embeddings (sqlite-backed).
+    
+    Entries expire after expire seconds and each namespace keeps its newest max_entries
+    rows, which bounds both the file and the linear scan in lookup.
+    """
+    
+    def __init__(self, db_path, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 expire: float = SEMANTIC_CACHE_EXPIRE_SECONDS,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        self.db_path = str(db_path)
+        self.threshold = threshold
+        self.expire = expire
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        # One connection shared across worker threads, serialized by the lock
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "namespace TEXT NOT NULL, embedding BLOB NOT NULL, content TEXT NOT NULL, "
+                "created_at REAL NOT NULL DEFAULT 0)"
+            )
+            # Stores created before expiry existed get the column; their rows count as expired
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+            if 'created_at' not in columns:
+                self._conn.execute("ALTER TABLE entries ADD COLUMN created_at REAL NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_namespace ON entries (namespace)")
+    
+    def lookup(self, namespace: str, embedding: List[float]) -> Optional[str]:
+        """Return the cached response most similar to embedding, if above the threshold."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT embedding, content FROM entries WHERE namespace = ? AND created_at >= ?",
+                (namespace, time.time() - self.expire)
+            ).fetchall()
+        
+        if not rows:
+            return None
+        
+        query = np.asarray(embedding, dtype=np.float32)
+        matrix = np.stack([np.frombuffer(row[0], dtype=np.float32) for row in rows])
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        similarities = matrix @ query / np.where(norms == 0, 1, norms)
+        
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.threshold:
+            return rows[best][1]
+        return None
+    
+    def add(self, namespace: str, embedding: List[float], content: str):
+        """Store a response under its transcript embedding, pruning expired and surplus rows."""
+        blob = np.asarray(embedding, dtype=np.float32).tobytes()
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO entries (namespace, embedding, content, created_at) VALUES (?, ?, ?, ?)",
+                (namespace, blob, content, now)
+            )
+            self._conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.expire,))
+            self._conn.execute(
+                "DELETE FROM entries WHERE namespace = ? AND rowid NOT IN ("
+                "SELECT rowid FROM entries WHERE namespace = ? ORDER BY created_at DESC LIMIT ?)",
+                (namespace, namespace, self.max_entries)
+            )
+
+def get_semantic_cache() -> SemanticCache:
+    """Get the shared semantic cache, opening it on first use."""
+    global _semantic_cache
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache(SEMANTIC_CACHE_PATH)
+    return _semantic_cache
+
+def make_semantic_namespace(request: Dict[str, Any]) -> str:
+    """Key semantic matches by everything except the final user message (the transcript)."""
+    return make_cache_key({**request, "messages": request["messages"][:-1]})
@@ -1,19 +1,65 @@
 # Firebase utilities for Call Center Agent
 import os
-import json
+import threading
+import requests
 import firebase_admin
+from dataclasses import dataclass
+from functools import lru_cache
 from firebase_admin import credentials, firestore, auth
-import pyrebase
-from datetime import datetime
-from typing import Dict, Any, Optional
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, List, Optional
 
-from config.settings import load_env_variable, ENV_VARS, BASE_DIR
+from config.settings import load_env_variable, ENV_VARS, BASE_DIR, FIREBASE_AUTH_SETTINGS
+
+@dataclass(frozen=True, slots=True)
+class FirebaseConfig:
+    """Firebase settings read from the environment (None where unset)."""
+    api_key: Optional[str]
+    project_id: Optional[str]
+    service_account_path: Optional[str]
+    
+    @classmethod
+    def from_env(cls) -> 'FirebaseConfig':
+        """Read the settings, resolving a relative service account path against BASE_DIR."""
+        service_account_path = load_env_variable(ENV_VARS['FIREBASE_SERVICE_ACCOUNT_PATH'])
+        if service_account_path and not os.path.isabs(service_account_path):
+            # Drop a leading ./ so the path joins cleanly
+            if service_account_path.startswith('./'):
+                service_account_path = service_account_path[2:]
+            service_account_path = str(BASE_DIR / service_account_path)
+        
+        return cls(
+            api_key=load_env_variable(ENV_VARS['FIREBASE_API_KEY']),
+            project_id=load_env_variable(ENV_VARS['FIREBASE_PROJECT_ID']),
+            service_account_path=service_account_path
+        )
+
+@lru_cache(maxsize=None)
+def get_firebase_config() -> FirebaseConfig:
+    """Firebase settings, read from the environment once per process."""
+    return FirebaseConfig.from_env()
+
+def _require(value: Optional[str], var_name: str) -> str:
+    """Return a config value, raising like load_env_variable(required=True) if it is unset."""
+    if not value:
+        raise ValueError(f"Required environment variable {var_name} is not set")
+    return value
+
+def _create_auth_session() -> requests.Session:
+    """HTTP session for the Firebase Auth REST API, keeping connections alive between calls."""
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(
+        pool_connections=FIREBASE_AUTH_SETTINGS['POOL_CONNECTIONS'],
+        pool_maxsize=FIREBASE_AUTH_SETTINGS['POOL_MAXSIZE']
+    ))
+    return session
 
 class FirebaseAuth:
     """Firebase Authentication handler."""
     
     def __init__(self):
-        self.pyrebase_app = None
+        self.api_key = None
+        self.session = None
         self.initialize_firebase()
     
     def initialize_firebase(self):
@@ -22,8 +68,8 @@ class FirebaseAuth:
             # Initialize Firebase Admin SDK
             self._init_admin_sdk()
             
-            # Initialize Pyrebase for client auth
-            self._init_pyrebase()
+            # Initialize the REST client for email/password auth
+            self._init_client_auth()
             
         except Exception as e:
             print(f"Warning: Firebase initialization failed: {e}")
@@ -31,20 +77,9 @@ class FirebaseAuth:
     def _init_admin_sdk(self):
         """Initialize Firebase Admin SDK."""
         try:
-            service_account_path = load_env_variable(ENV_VARS['FIREBASE_SERVICE_ACCOUNT_PATH'])
-            project_id = load_env_variable(ENV_VARS['FIREBASE_PROJECT_ID'], required=True)
-
-            # Resolve the service account path relative to BASE_DIR
-            if service_account_path:
-                if service_account_path.startswith('./'):
-                    # Remove leading ./ and resolve relative to BASE_DIR
-                    relative_path = service_account_path[2:]
-                    absolute_path = BASE_DIR / relative_path
-                    service_account_path = str(absolute_path)
-                elif not os.path.isabs(service_account_path):
-                    # If it's a relative path without ./, resolve relative to BASE_DIR
-                    absolute_path = BASE_DIR / service_account_path
-                    service_account_path = str(absolute_path)
+            config = get_firebase_config()
+            project_id = _require(config.project_id, ENV_VARS['FIREBASE_PROJECT_ID'])
+            service_account_path = config.service_account_path
 
             if service_account_path and os.path.exists(service_account_path):
                 cred = credentials.Certificate(service_account_path)
@@ -58,36 +93,45 @@ class FirebaseAuth:
         except Exception as e:
             print(f"⚠️  Firebase Admin SDK initialization failed: {e}")
     
-    def _init_pyrebase(self):
-        """Initialize Pyrebase for client authentication."""
+    def _init_client_auth(self):
+        """Initialize the Firebase Auth REST client used for email/password auth."""
         try:
-            config = {
-                "apiKey": load_env_variable(ENV_VARS['FIREBASE_API_KEY'], required=True),
-                "authDomain": load_env_variable(ENV_VARS['FIREBASE_AUTH_DOMAIN'], required=True),
-                "projectId": load_env_variable(ENV_VARS['FIREBASE_PROJECT_ID'], required=True),
-                "storageBucket": load_env_variable(ENV_VARS['FIREBASE_STORAGE_BUCKET'], required=True),
-                "messagingSenderId": load_env_variable(ENV_VARS['FIREBASE_MESSAGING_SENDER_ID'], required=True),
-                "appId": load_env_variable(ENV_VARS['FIREBASE_APP_ID'], required=True),
-                "databaseURL": load_env_variable(ENV_VARS['FIREBASE_DATABASE_URL'])
-            }
-            
-            self.pyrebase_app = pyrebase.initialize_app(config)
-            print("✅ Pyrebase initialized successfully")
+            self.api_key = _require(get_firebase_config().api_key, ENV_VARS['FIREBASE_API_KEY'])
+            self.session = _create_auth_session()
+            print("✅ Firebase Auth REST client initialized successfully")
             
         except Exception as e:
-            print(f"⚠️  Pyrebase initialization failed: {e}")
+            print(f"⚠️  Firebase Auth REST client initialization failed: {e}")
+    
+    def _post(self, url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST to a Firebase Auth endpoint, raising with the response body (which holds
+        error codes such as EMAIL_EXISTS) on failure."""
+        response = self.session.post(
+            url, params={'key': self.api_key}, json=payload,
+            timeout=FIREBASE_AUTH_SETTINGS['TIMEOUT_SECONDS']
+        )
+        if not response.ok:
+            raise requests.HTTPError(f"{response.status_code} {response.reason}: {response.text}", response=response)
+        return response.json()
+    
+    def _accounts_url(self, method: str) -> str:
+        """URL of an Identity Toolkit accounts endpoint (signUp, signInWithPassword, ...)."""
+        return f"{FIREBASE_AUTH_SETTINGS['IDENTITY_TOOLKIT_URL']}/accounts:{method}"
     
     def create_user(self, email: str, password: str, display_name: str = None) -> Dict[str, Any]:
         """Create a new user account."""
         try:
-            if not self.pyrebase_app:
+            if not self.session:
                 return {"status": "error", "message": "Firebase not initialized"}
             
-            auth_client = self.pyrebase_app.auth()
-            user = auth_client.create_user_with_email_and_password(email, password)
+            user = self._post(self._accounts_url('signUp'), {
+                "email": email, "password": password, "returnSecureToken": True
+            })
             
             # Send email verification
-            auth_client.send_email_verification(user['idToken'])
+            self._post(self._accounts_url('sendOobCode'), {
+                "requestType": "VERIFY_EMAIL", "idToken": user['idToken']
+            })
             
             return {
                 "status": "success",
@@ -113,11 +157,12 @@ class FirebaseAuth:
     def login_user(self, email: str, password: str) -> Dict[str, Any]:
         """Login user with email and password."""
         try:
-            if not self.pyrebase_app:
+            if not self.session:
                 return {"status": "error", "message": "Firebase not initialized"}
             
-            auth_client = self.pyrebase_app.auth()
-            user = auth_client.sign_in_with_email_and_password(email, password)
+            user = self._post(self._accounts_url('signInWithPassword'), {
+                "email": email, "password": password, "returnSecureToken": True
+            })
             
             return {
                 "status": "success",
@@ -158,16 +203,18 @@ class FirebaseAuth:
     def refresh_token(self, refresh_token: str) -> Dict[str, Any]:
         """Refresh Firebase token."""
         try:
-            if not self.pyrebase_app:
+            if not self.session:
                 return {"status": "error", "message": "Firebase not initialized"}
             
-            auth_client = self.pyrebase_app.auth()
-            user = auth_client.refresh(refresh_token)
+            # The token endpoint answers in snake_case
+            user = self._post(FIREBASE_AUTH_SETTINGS['SECURE_TOKEN_URL'], {
+                "grant_type": "refresh_token", "refresh_token": refresh_token
+            })
             
             return {
                 "status": "success",
-                "token": user['idToken'],
-                "refresh_token": user['refreshToken']
+                "token": user['id_token'],
+                "refresh_token": user['refresh_token']
             }
         except Exception as e:
             return {"status": "error", "message": f"Token refresh failed: {str(e)}"}
@@ -184,14 +231,24 @@ class FirebaseDatabase:
         """Initialize Firestore database."""
         try:
             self.db = firestore.client()
-            # Test connection
-            test_doc = self.db.collection('_test').document('connection')
-            test_doc.set({'timestamp': datetime.now(), 'test': True}, merge=True)
-            print("✅ Firestore client initialized and connection verified")
+            print("✅ Firestore client initialized")
         except Exception as e:
             print(f"⚠️  Failed to initialize Firestore: {e}")
             self.db = None
     
+    def health_check(self) -> Dict[str, Any]:
+        """Verify the Firestore connection with a test write."""
+        try:
+            if not self.db:
+                return {"status": "error", "message": "Database not initialized"}
+            
+            test_doc = self.db.collection('_test').document('connection')
+            test_doc.set({'timestamp': firestore.SERVER_TIMESTAMP, 'test': True}, merge=True)
+            return {"status": "success", "message": "Connection verified"}
+            
+        except Exception as e:
+            return {"status": "error", "message": f"Connection check failed: {str(e)}"}
+    
     def save_processing_result(self, uid: str, processing_data: Dict[str, Any]) -> Dict[str, Any]:
         """Save audio processing result to user's history."""
         try:
@@ -204,41 +261,52 @@ class FirebaseDatabase:
                 'audio_url': processing_data.get('audio_url'),
                 'processing_type': processing_data.get('processing_type', 'audio_analysis'),
                 'results': processing_data.get('results', {}),
-                'timestamp': datetime.now(),
+                'timestamp': firestore.SERVER_TIMESTAMP,
                 'status': processing_data.get('status', 'completed'),
                 'processing_time': processing_data.get('processing_time', 0),
                 'file_size': processing_data.get('file_size', 0),
                 'metadata': processing_data.get('metadata', {})
             }
             
-            # Add to processing history
-            doc_ref = self.db.collection('processing_history').add(processing_record)
+            # Add to processing history and update user usage stats in one atomic commit
+            batch = self.db.batch()
+            doc_ref = self.db.collection('processing_history').document()
+            batch.set(doc_ref, processing_record)
             
-            # Update user usage stats
+            # A merged set (unlike update) also works for users without a profile document,
+            # which would otherwise fail the whole batch
             user_ref = self.db.collection('users').document(uid)
-            user_ref.update({
-                'usage_stats.files_processed': firestore.Increment(1),
-                'usage_stats.total_processing_time': firestore.Increment(processing_record['processing_time']),
-                'usage_stats.last_activity': datetime.now()
-            })
+            batch.set(user_ref, {
+                'usage_stats': {
+                    'files_processed': firestore.Increment(1),
+                    'total_processing_time': firestore.Increment(processing_record['processing_time']),
+                    'last_activity': firestore.SERVER_TIMESTAMP
+                }
+            }, merge=True)
+            
+            batch.commit()
             
             return {
                 "status": "success",
                 "message": "Processing result saved",
-                "document_id": doc_ref[1].id
+                "document_id": doc_ref.id
             }
             
         except Exception as e:
             return {"status": "error", "message": f"Failed to save result: {str(e)}"}
     
-    def get_user_history(self, uid: str, limit: int = 10) -> Dict[str, Any]:
-        """Get user's processing history."""
+    def get_user_history(self, uid: str, limit: int = 10, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Get user's processing history (only the given fields of each record, if any)."""
         try:
             if not self.db:
                 return {"status": "error", "message": "Database not initialized"}
             
             query = (self.db.collection('processing_history')
-                    .where('uid', '==', uid)
+                    .where('uid', '==', uid))
+            if fields:
+                # Projection: the results/metadata blobs are never sent over the wire
+                query = query.select(fields)
+            query = (query
                     .order_by('timestamp', direction=firestore.Query.DESCENDING)
                     .limit(limit))
             
@@ -278,6 +346,18 @@ class FirebaseDatabase:
             return {"status": "error", "message": f"Failed to get profile: {str(e)}"}
 
 
-# Global instances
-firebase_auth = FirebaseAuth()
-firebase_db = FirebaseDatabase()
+# Global instances, created on first access (PEP 562) so importing this module doesn't
+# initialize Firebase
+_instances_lock = threading.Lock()
+
+def __getattr__(name: str):
+    if name not in ('firebase_auth', 'firebase_db'):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    
+    with _instances_lock:
+        if 'firebase_auth' not in globals():
+            # Firestore connects through the Admin SDK app that FirebaseAuth initializes
+            globals()['firebase_auth'] = FirebaseAuth()
+        if name == 'firebase_db' and 'firebase_db' not in globals():
+            globals()['firebase_db'] = FirebaseDatabase()
+        return globals()[name]
@@ -2,36 +2,50 @@
 import re
 import os
 import hashlib
-from urllib.parse import urlparse, parse_qs
+from functools import lru_cache
+from urllib.parse import urlparse, unquote_plus
 from typing import Optional
 from pathlib import Path
 
+from config.settings import AUDIO_EXTENSIONS, TRANSCRIPT_TURN_CHAR_LIMIT
+
+# Lowercased for a single str.endswith call per filename
+_AUDIO_EXTENSIONS = tuple(ext.lower() for ext in AUDIO_EXTENSIONS)
+
+# Google Drive/Docs URL shapes that carry the file (or folder) ID in the path
+_DRIVE_FILE_PATTERN = re.compile(r'/file/d/([a-zA-Z0-9-_]+)')
+_DRIVE_FOLDER_PATTERN = re.compile(r'/folders/([a-zA-Z0-9-_]+)')
+_DOCS_FILE_PATTERN = re.compile(r'/(?:document|spreadsheets|presentation)/d/([a-zA-Z0-9-_]+)')
+_DRIVE_HOSTS = frozenset(('drive.google.com', 'docs.google.com'))
+_DRIVE_URL_PREFIXES = ('https://drive.google.com/', 'https://docs.google.com/')
+# First non-empty id= parameter, matched against '&' + query string
+_ID_PARAM_PATTERN = re.compile(r'&id=([^&]+)')
+
+@lru_cache(maxsize=4096)
 def extract_google_drive_file_id(url: str) -> Optional[str]:
     """Extract file ID from various Google Drive URL formats."""
     if not url:
         return None
     
     # Pattern 1: /file/d/FILE_ID/
-    pattern1 = r'/file/d/([a-zA-Z0-9-_]+)'
-    match = re.search(pattern1, url)
+    match = _DRIVE_FILE_PATTERN.search(url)
     if match:
         return match.group(1)
     
-    # Pattern 2: ?id=FILE_ID
-    parsed_url = urlparse(url)
-    query_params = parse_qs(parsed_url.query)
-    if 'id' in query_params:
-        return query_params['id'][0]
+    # Pattern 2: ?id=FILE_ID (the same value parse_qs would give, without building the whole dict)
+    query = url.partition('#')[0].partition('?')[2]
+    match = _ID_PARAM_PATTERN.search('&' + query) if query else None
+    if match:
+        value = match.group(1)
+        return unquote_plus(value) if '%' in value or '+' in value else value
     
     # Pattern 3: /folders/FOLDER_ID for folder links
-    pattern3 = r'/folders/([a-zA-Z0-9-_]+)'
-    match = re.search(pattern3, url)
+    match = _DRIVE_FOLDER_PATTERN.search(url)
     if match:
         return match.group(1)
     
     # Pattern 4: Google Docs/Sheets/Slides - /document/d/FILE_ID/, /spreadsheets/d/FILE_ID/, /presentation/d/FILE_ID/
-    pattern4 = r'/(?:document|spreadsheets|presentation)/d/([a-zA-Z0-9-_]+)'
-    match = re.search(pattern4, url)
+    match = _DOCS_FILE_PATTERN.search(url)
     if match:
         return match.group(1)
     
@@ -39,6 +53,17 @@ def extract_google_drive_file_id(url: str) -> Optional[str]:
 
 def get_audio_file_identifier(audio_url: Optional[str] = None, local_path: Optional[str] = None) -> str:
     """Generate a unique identifier for an audio file."""
+    file_id = _file_identifier(audio_url, local_path)
+    if file_id:
+        return file_id
+    
+    # Fallback
+    import time
+    return f"audio_{int(time.time())}_MPE"
+
+@lru_cache(maxsize=4096)
+def _file_identifier(audio_url: Optional[str], local_path: Optional[str]) -> Optional[str]:
+    """Identifier derived from the URL or path (deterministic, so memoized), or None."""
     if audio_url:
         file_id = extract_google_drive_file_id(audio_url)
         if file_id:
@@ -51,12 +76,10 @@ def get_audio_file_identifier(audio_url: Optional[str] = None, local_path: Optio
             return f"{filename}_MPE"
         else:
             # Create hash of the full path
-            path_hash = hashlib.md5(local_path.encode()).hexdigest()[:8]
+            path_hash = hashlib.blake2b(local_path.encode(), digest_size=4).hexdigest()
             return f"local_{path_hash}_MPE"
     
-    # Fallback
-    import time
-    return f"audio_{int(time.time())}_MPE"
+    return None
 
 def is_valid_google_drive_link(url: str) -> bool:
     """Check if URL is a valid Google Drive link."""
@@ -64,22 +87,23 @@ def is_valid_google_drive_link(url: str) -> bool:
         return False
     
     try:
-        parsed = urlparse(url)
-        return (parsed.hostname in ['drive.google.com', 'docs.google.com'] and
-                extract_google_drive_file_id(url) is not None)
+        # Plain https links skip the URL parser; anything else is checked by hostname
+        if not url.startswith(_DRIVE_URL_PREFIXES) and urlparse(url).hostname not in _DRIVE_HOSTS:
+            return False
+        return extract_google_drive_file_id(url) is not None
     except:
         return False
 
 def is_audio_file(filename: str) -> bool:
     """Check if filename has a valid audio extension."""
-    from config.settings import AUDIO_EXTENSIONS
-    return any(filename.lower().endswith(ext) for ext in AUDIO_EXTENSIONS)
+    return filename.lower().endswith(_AUDIO_EXTENSIONS)
 
 def get_file_size_mb(file_path: str) -> float:
     """Get file size in megabytes."""
-    if not os.path.exists(file_path):
+    try:
+        return os.stat(file_path).st_size / (1024 * 1024)
+    except (OSError, ValueError):
         return 0.0
-    return os.path.getsize(file_path) / (1024 * 1024)
 
 def sanitize_filename(filename: str) -> str:
     """Sanitize filename for safe file system operations."""
@@ -95,25 +119,22 @@ def sanitize_filename(filename: str) -> str:
     
     return filename
 
-def create_temp_audio_file(suffix: str = '.wav') -> str:
-    """Create a temporary audio file path."""
+def create_temp_audio_file(suffix: str = '.wav', directory: Optional[str] = None) -> str:
+    """Create a temporary audio file path (in directory if given, else the system temp dir)."""
     import tempfile
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=directory) as tmp_file:
         return tmp_file.name
 
 def format_duration(seconds: float) -> str:
     """Format duration in seconds to human readable format."""
     if seconds < 60:
         return f"{seconds:.1f}s"
-    elif seconds < 3600:
-        minutes = int(seconds // 60)
-        secs = seconds % 60
-        return f"{minutes}m {secs:.1f}s"
-    else:
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = seconds % 60
+    
+    minutes, secs = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    if hours:
         return f"{hours}h {minutes}m {secs:.1f}s"
+    return f"{minutes}m {secs:.1f}s"
 
 def validate_audio_file(file_path: str) -> dict:
     """Validate audio file and return status info."""
@@ -126,12 +147,15 @@ def validate_audio_file(file_path: str) -> dict:
     }
     
     try:
-        if not os.path.exists(file_path):
+        # One stat answers both "does it exist" and "how big is it"
+        try:
+            size = os.stat(file_path).st_size
+        except (OSError, ValueError):
             result['error'] = 'File does not exist'
             return result
         
         result['exists'] = True
-        result['size_mb'] = get_file_size_mb(file_path)
+        result['size_mb'] = size / (1024 * 1024)
         
         if result['size_mb'] == 0:
             result['error'] = 'File is empty'
@@ -149,6 +173,11 @@ def validate_audio_file(file_path: str) -> dict:
     
     return result
 
+# Control characters that might interfere with processing, as a str.translate deletion table
+_CONTROL_CHARS_TABLE = dict.fromkeys(
+    [*range(0x00, 0x09), 0x0b, 0x0c, *range(0x0e, 0x20), *range(0x7f, 0xa0)]
+)
+
 def clean_text_for_processing(text: str) -> str:
     """Clean and normalize text for processing."""
     if not text:
@@ -158,6 +187,84 @@ def clean_text_for_processing(text: str) -> str:
     text = ' '.join(text.split())
     
     # Remove special characters that might interfere with processing
-    text = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]', '', text)
+    text = text.translate(_CONTROL_CHARS_TABLE)
     
     return text.strip()
+
+@lru_cache(maxsize=64)
+def _load_clean_transcript(path: str, mtime_ns: int, size: int) -> str:
+    """Read and clean a transcript; the stat fields make edited files miss the cache."""
+    return clean_text_for_processing(Path(path).read_text(encoding='utf-8'))
+
+def load_clean_transcript(transcript_path: str) -> str:
+    """Read and clean a transcript, reusing the result while the file is unchanged."""
+    stat = os.stat(transcript_path)
+    # Empty files are caught by the stat instead of reading them
+    if stat.st_size == 0:
+        return ""
+    return _load_clean_transcript(os.path.abspath(transcript_path), stat.st_mtime_ns, stat.st_size)
+
+def write_utf8_file(file_path, text: str):
+    """Write text as UTF-8 with plain os.write calls, skipping the TextIOWrapper/buffer layers."""
+    data = memoryview(text.encode('utf-8'))
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        # os.write may write less than asked for; keep going until everything is out
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+# Leading timestamps such as "[00:01:23]", "(01:05)" or "00:01:23.5"
+_TIMESTAMP_PATTERN = re.compile(r'^\s*[\[(]?\d{1,2}:\d{2}(?::\d{2})?(?:[.,]\d+)?[\])]?\s*')
+# "Speaker: utterance" lines as produced by the transcription agent ("Callcenter:", "Patient:");
+# a label is a single word of letters, so times like "10:30" in unlabelled text don't match
+_SPEAKER_TURN_PATTERN = re.compile(r'^([^\W\d_]{1,20}):\s*(.*)$')
+
+def compress_transcript_for_eval(text: str, max_turn_chars: int = TRANSCRIPT_TURN_CHAR_LIMIT) -> str:
+    """Compact a speaker-labelled transcript to cut prompt tokens for evaluation.
+    
+    Strips leading timestamps, drops a line that repeats the line right before it
+    (transcription stutter), merges consecutive lines by the same speaker and, when
+    the transcript has at least two speakers, caps each source line at max_turn_chars.
+    Unlabelled or single-speaker text is never truncated.
+    """
+    if not text:
+        return ""
+    
+    parsed = []  # (speaker or None, utterance)
+    for line in text.splitlines():
+        line = _TIMESTAMP_PATTERN.sub('', line).strip()
+        if not line:
+            continue
+        match = _SPEAKER_TURN_PATTERN.match(line)
+        if match:
+            parsed.append((match.group(1).strip(), match.group(2).strip()))
+        else:
+            parsed.append((None, line))
+    
+    # Only cap lines when there is real turn-taking to keep
+    cap_lines = len({speaker for speaker, _ in parsed if speaker is not None}) > 1
+    
+    turns = []  # [speaker, [utterances]]
+    previous = None
+    for speaker, utterance in parsed:
+        if speaker is None:
+            # Unlabelled lines continue the previous speaker's turn
+            speaker = turns[-1][0] if turns else ""
+        if not utterance or (speaker, utterance) == previous:
+            continue
+        previous = (speaker, utterance)
+        
+        if cap_lines and len(utterance) > max_turn_chars:
+            utterance = utterance[:max_turn_chars].rstrip() + '…'
+        
+        if turns and turns[-1][0] == speaker:
+            turns[-1][1].append(utterance)
+        else:
+            turns.append([speaker, [utterance]])
+    
+    return '\n'.join(
+        f"{speaker}: {' '.join(utterances)}" if speaker else ' '.join(utterances)
+        for speaker, utterances in turns
+    )
@@ -0,0 +1,328 @@
+# OpenAI client utilities for Call Center Agent
+import time
+import atexit
+import asyncio
+import threading
+import weakref
+from functools import lru_cache
+from typing import Any, Callable, Coroutine, Dict, Optional, Tuple
+import httpx
+import tiktoken
+from openai import (
+    OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient,
+    RateLimitError, APIConnectionError, InternalServerError
+)
+
+from config.settings import (
+    load_env_variable, ENV_VARS, OPENAI_RETRY_SETTINGS, OPENAI_HTTP_SETTINGS, OPENAI_MODELS,
+    CACHE_EXPIRE_SECONDS, SEMANTIC_CACHE_ENABLED, PROMPT_TOKEN_BUDGET, EMBEDDING_MAX_TOKENS
+)
+from utils.cache import get_response_cache, make_cache_key, get_semantic_cache, make_semantic_namespace
+
+# Errors worth retrying: rate limits, dropped connections/timeouts and 5xx responses
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
+_client = None
+_client_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+_pipeline_loop = None
+_pipeline_loop_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def _openai_api_key() -> str:
+    """The OpenAI API key, read from the environment once per process (a missing key is not cached)."""
+    return load_env_variable(ENV_VARS['OPENAI_API_KEY'], required=True)
+
+def _http_client_options() -> Dict[str, Any]:
+    """httpx settings shared by the sync and async OpenAI transports."""
+    return {
+        "http2": OPENAI_HTTP_SETTINGS['HTTP2'],
+        "limits": httpx.Limits(
+            max_connections=OPENAI_HTTP_SETTINGS['MAX_CONNECTIONS'],
+            max_keepalive_connections=OPENAI_HTTP_SETTINGS['MAX_KEEPALIVE_CONNECTIONS']
+        ),
+        "timeout": httpx.Timeout(
+            OPENAI_RETRY_SETTINGS['REQUEST_TIMEOUT_SECONDS'],
+            connect=OPENAI_HTTP_SETTINGS['CONNECT_TIMEOUT_SECONDS']
+        )
+    }
+
+def get_openai_client() -> OpenAI:
+    """Get the process-wide OpenAI client so all agents share one connection pool."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            # Retries are handled by call_with_retries, so the SDK's own retries are disabled
+            _client = OpenAI(
+                api_key=_openai_api_key(),
+                max_retries=0,
+                timeout=OPENAI_RETRY_SETTINGS['REQUEST_TIMEOUT_SECONDS'],
+                http_client=DefaultHttpxClient(**_http_client_options())
+            )
+        return _client
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Get the AsyncOpenAI client for the running event loop.
+    
+    Async connections are bound to the loop that opened them, so each loop gets its
+    own client. The pipeline runs on the long-lived loop from get_pipeline_loop, so
+    in practice every request shares that loop's client and connection pool.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncOpenAI(
+            api_key=_openai_api_key(),
+            max_retries=0,
+            timeout=OPENAI_RETRY_SETTINGS['REQUEST_TIMEOUT_SECONDS'],
+            http_client=DefaultAsyncHttpxClient(**_http_client_options())
+        )
+        _async_clients[loop] = client
+    return client
+
+def get_pipeline_loop() -> asyncio.AbstractEventLoop:
+    """Get the background event loop the async pipeline runs on, starting it on first use."""
+    global _pipeline_loop
+    with _pipeline_loop_lock:
+        if _pipeline_loop is None:
+            _pipeline_loop = asyncio.new_event_loop()
+            threading.Thread(target=_pipeline_loop.run_forever, name="openai-pipeline", daemon=True).start()
+            atexit.register(_stop_pipeline_loop)
+            # Build the tiktoken encoders (a download on first use) before the pipeline needs them
+            threading.Thread(target=_warm_token_encoders, name="token-encoder-warmup", daemon=True).start()
+        return _pipeline_loop
+
+def _stop_pipeline_loop():
+    """Cancel whatever is still running on the pipeline loop and stop it (at interpreter exit)."""
+    async def cancel_tasks():
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    try:
+        asyncio.run_coroutine_threadsafe(cancel_tasks(), _pipeline_loop).result(timeout=5)
+    except Exception as e:
+        print(f"⚠️  Pipeline loop did not shut down cleanly: {str(e)}")
+    _pipeline_loop.call_soon_threadsafe(_pipeline_loop.stop)
+
+async def run_on_pipeline_loop(coro: Coroutine[Any, Any, Any]) -> Any:
+    """Await a coroutine on the pipeline loop from any event loop (directly if already on it)."""
+    loop = get_pipeline_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+def run_on_pipeline_loop_sync(coro: Coroutine[Any, Any, Any]) -> Any:
+    """Run a coroutine on the pipeline loop and block until it finishes (for sync callers).
+    
+    Works from threads with or without their own running loop, except the pipeline loop
+    itself, which would deadlock; coroutines there must await the *_async variant instead.
+    """
+    loop = get_pipeline_loop()
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+    if running_loop is loop:
+        coro.close()
+        raise RuntimeError("Synchronous pipeline call made from the pipeline event loop; "
+                           "await the *_async variant instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+@lru_cache(maxsize=None)
+def get_token_encoder(model: str) -> Optional[tiktoken.Encoding]:
+    """Get the (expensive to build) tiktoken encoder for a model, or None if it cannot be loaded."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception as e:
+        print(f"⚠️  Token encoder unavailable for {model}, skipping prompt budget checks: {str(e)}")
+        return None
+
+def _warm_token_encoders():
+    """Load the encoders of every model whose prompts are tokenized."""
+    for key in ('SUMMARY', 'EVALUATION', 'RECOMMENDATION', 'EMBEDDING'):
+        get_token_encoder(OPENAI_MODELS[key])
+
+def check_prompt_budget(text: str, model: str) -> Optional[str]:
+    """Return an error message if text exceeds PROMPT_TOKEN_BUDGET for model, otherwise None."""
+    encoder = get_token_encoder(model)
+    if encoder is None:
+        return None
+    
+    token_count = len(encoder.encode(text, disallowed_special=()))
+    if token_count > PROMPT_TOKEN_BUDGET:
+        return f"Transcript too long: {token_count} tokens exceeds the {PROMPT_TOKEN_BUDGET} token budget"
+    return None
+
+async def acheck_prompt_budget(text: str, model: str) -> Optional[str]:
+    """Async variant of check_prompt_budget; tokenizing (and any encoder load) runs off the event loop."""
+    return await asyncio.to_thread(check_prompt_budget, text, model)
+
+def truncate_for_embedding(text: str) -> Optional[str]:
+    """Cut text to the embedding model's input limit, or None if it cannot be tokenized."""
+    encoder = get_token_encoder(OPENAI_MODELS['EMBEDDING'])
+    if encoder is None:
+        return None
+    
+    tokens = encoder.encode(text, disallowed_special=())
+    if len(tokens) <= EMBEDDING_MAX_TOKENS:
+        return text
+    return encoder.decode(tokens[:EMBEDDING_MAX_TOKENS])
+
+def call_with_retries(func, *args, **kwargs):
+    """Call an OpenAI SDK method, retrying transient failures with exponential backoff."""
+    delay = OPENAI_RETRY_SETTINGS['INITIAL_DELAY_SECONDS']
+    
+    for attempt in range(OPENAI_RETRY_SETTINGS['MAX_RETRIES'] + 1):
+        try:
+            return func(*args, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            if attempt == OPENAI_RETRY_SETTINGS['MAX_RETRIES']:
+                raise
+            print(f"⚠️  OpenAI request failed ({type(e).__name__}), retrying in {delay}s...")
+            time.sleep(delay)
+            delay *= 2
+
+async def acall_with_retries(func, *args, **kwargs):
+    """Await an async OpenAI SDK method, retrying transient failures with exponential backoff."""
+    delay = OPENAI_RETRY_SETTINGS['INITIAL_DELAY_SECONDS']
+    
+    for attempt in range(OPENAI_RETRY_SETTINGS['MAX_RETRIES'] + 1):
+        try:
+            return await func(*args, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            if attempt == OPENAI_RETRY_SETTINGS['MAX_RETRIES']:
+                raise
+            print(f"⚠️  OpenAI request failed ({type(e).__name__}), retrying in {delay}s...")
+            await asyncio.sleep(delay)
+            delay *= 2
+
+def _stream_chat_completion(client, request: Dict[str, Any],
+                            on_delta: Optional[Callable[[str], Any]] = None) -> Tuple[Optional[str], Any]:
+    """Run a streamed chat completion, collecting content deltas (and passing each to on_delta) as they arrive."""
+    stream = call_with_retries(
+        client.chat.completions.create, **request, stream=True, stream_options={"include_usage": True}
+    )
+    
+    parts = []
+    usage = None
+    with stream:
+        for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                if on_delta:
+                    on_delta(chunk.choices[0].delta.content)
+    
+    return "".join(parts) or None, usage
+
+async def _astream_chat_completion(client, request: Dict[str, Any],
+                                   on_delta: Optional[Callable[[str], Any]] = None) -> Tuple[Optional[str], Any]:
+    """Async variant of _stream_chat_completion; yields to the event loop between chunks."""
+    stream = await acall_with_retries(
+        client.chat.completions.create, **request, stream=True, stream_options={"include_usage": True}
+    )
+    
+    parts = []
+    usage = None
+    async with stream:
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                if on_delta:
+                    on_delta(chunk.choices[0].delta.content)
+    
+    return "".join(parts) or None, usage
+
+def _replay_cached(content: str, on_delta: Optional[Callable[[str], Any]]) -> Tuple[str, Any, bool]:
+    """Hand a cached response to on_delta and build the cache-hit return value."""
+    if on_delta:
+        on_delta(content)
+    return content, None, True
+
+def _add_to_semantic_cache(request: Dict[str, Any], embedding, content: str):
+    """Store a fresh response in the semantic cache; a failure here must not lose the response."""
+    try:
+        get_semantic_cache().add(make_semantic_namespace(request), embedding, content)
+    except Exception as e:
+        print(f"⚠️  Could not store response in semantic cache: {str(e)}")
+
+def create_chat_completion(client, request: Dict[str, Any], semantic_text: Optional[str] = None,
+                           on_delta: Optional[Callable[[str], Any]] = None) -> Tuple[Optional[str], Any, bool]:
+    """Run a chat completion, serving repeats from the response cache.
+    
+    When semantic_text is given and SEMANTIC_CACHE=1, near-duplicate texts are also
+    matched by embedding similarity. on_delta receives the content as it streams in
+    (a cached response arrives as one piece). Returns (content, usage, cache_hit);
+    usage is None for cached responses.
+    """
+    cache = get_response_cache()
+    cache_key = make_cache_key(request)
+    
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return _replay_cached(cached, on_delta)
+    
+    embedding = None
+    if semantic_text and SEMANTIC_CACHE_ENABLED:
+        # The semantic cache is best effort; any failure falls through to a normal completion
+        try:
+            embedding_input = truncate_for_embedding(semantic_text)
+            if embedding_input:
+                embedding = call_with_retries(
+                    client.embeddings.create, model=OPENAI_MODELS['EMBEDDING'], input=embedding_input
+                ).data[0].embedding
+                cached = get_semantic_cache().lookup(make_semantic_namespace(request), embedding)
+                if cached is not None:
+                    return _replay_cached(cached, on_delta)
+        except Exception as e:
+            print(f"⚠️  Semantic cache lookup failed, skipping it: {str(e)}")
+            embedding = None
+    
+    content, usage = _stream_chat_completion(client, request, on_delta)
+    if content:
+        cache.set(cache_key, content, expire=CACHE_EXPIRE_SECONDS)
+        if embedding is not None:
+            _add_to_semantic_cache(request, embedding, content)
+    
+    return content, usage, False
+
+async def acreate_chat_completion(client, request: Dict[str, Any], semantic_text: Optional[str] = None,
+                                  on_delta: Optional[Callable[[str], Any]] = None) -> Tuple[Optional[str], Any, bool]:
+    """Async variant of create_chat_completion for AsyncOpenAI clients."""
+    cache = get_response_cache()
+    cache_key = make_cache_key(request)
+    
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return _replay_cached(cached, on_delta)
+    
+    embedding = None
+    if semantic_text and SEMANTIC_CACHE_ENABLED:
+        # The semantic cache is best effort; any failure falls through to a normal completion
+        try:
+            embedding_input = await asyncio.to_thread(truncate_for_embedding, semantic_text)
+            if embedding_input:
+                embedding = (await acall_with_retries(
+                    client.embeddings.create, model=OPENAI_MODELS['EMBEDDING'], input=embedding_input
+                )).data[0].embedding
+                cached = await asyncio.to_thread(
+                    get_semantic_cache().lookup, make_semantic_namespace(request), embedding
+                )
+                if cached is not None:
+                    return _replay_cached(cached, on_delta)
+        except Exception as e:
+            print(f"⚠️  Semantic cache lookup failed, skipping it: {str(e)}")
+            embedding = None
+    
+    content, usage = await _astream_chat_completion(client, request, on_delta)
+    if content:
+        cache.set(cache_key, content, expire=CACHE_EXPIRE_SECONDS)
+        if embedding is not None:
+            await asyncio.to_thread(_add_to_semantic_cache, request, embedding, content)
+    
+    return content, usage, False